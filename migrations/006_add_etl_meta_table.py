@@ -0,0 +1,29 @@
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(conn: sqlite3.Connection):
+    """
+    バージョン6へのアップグレード。
+    - ロード済みの元ファイル（パス・更新日時）を記録する `etl_meta` テーブルを作成する。
+      table_name には、仕掛・在庫関連のテーブル名（WipDataProcessor.run_all）のほか、
+      生産実績ファイルの処理記録のキー 'production_records'（src/models/database.py の PRODUCTION_META_KEY）が入る。
+      etl_meta の行をすべて仕掛・在庫関連テーブルとして扱わないこと。
+    """
+    logger.info("Applying migration 006: Create etl_meta table...")
+    cursor = conn.cursor()
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS etl_meta (
+        table_name TEXT PRIMARY KEY,
+        source_path TEXT NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        row_count INTEGER NOT NULL,
+        loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    logger.info("Table 'etl_meta' created or already exists.")
+
+    conn.commit()
+    print("Migration 006 applied successfully.")
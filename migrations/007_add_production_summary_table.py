@@ -0,0 +1,67 @@
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(conn: sqlite3.Connection):
+    """
+    バージョン7へのアップグレード。
+    - 生産実績の件数・数量の合計を1行で保持する `production_summary` テーブルを作成する。
+    - `production_records` への挿入・削除時にトリガーで集計を更新する。
+      INSERT OR IGNOREで無視された重複行ではトリガーが実行されないため、実際に保存された行だけが集計される。
+    """
+    logger.info("Applying migration 007: Create production_summary table...")
+    cursor = conn.cursor()
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS production_summary (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        record_count INTEGER NOT NULL DEFAULT 0,
+        total_order_quantity INTEGER NOT NULL DEFAULT 0,
+        total_actual_quantity INTEGER NOT NULL DEFAULT 0,
+        latest_input_datetime TIMESTAMP
+    );
+    """)
+    logger.info("Table 'production_summary' created or already exists.")
+
+    # 既存のレコードから初期値を計算する
+    cursor.execute("""
+    INSERT OR REPLACE INTO production_summary (
+        id, record_count, total_order_quantity, total_actual_quantity, latest_input_datetime
+    )
+    SELECT 1, COUNT(*), COALESCE(SUM(order_quantity), 0), COALESCE(SUM(actual_quantity), 0), MAX(input_datetime)
+    FROM production_records;
+    """)
+
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_production_summary_insert
+    AFTER INSERT ON production_records
+    BEGIN
+        UPDATE production_summary SET
+            record_count = record_count + 1,
+            total_order_quantity = total_order_quantity + NEW.order_quantity,
+            total_actual_quantity = total_actual_quantity + NEW.actual_quantity,
+            latest_input_datetime = CASE
+                WHEN latest_input_datetime IS NULL OR NEW.input_datetime > latest_input_datetime
+                THEN NEW.input_datetime ELSE latest_input_datetime END
+        WHERE id = 1;
+    END;
+    """)
+
+    # 削除は通常の処理では発生しないため、最新の入力日時はテーブルから求め直す
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_production_summary_delete
+    AFTER DELETE ON production_records
+    BEGIN
+        UPDATE production_summary SET
+            record_count = record_count - 1,
+            total_order_quantity = total_order_quantity - OLD.order_quantity,
+            total_actual_quantity = total_actual_quantity - OLD.actual_quantity,
+            latest_input_datetime = (SELECT MAX(input_datetime) FROM production_records)
+        WHERE id = 1;
+    END;
+    """)
+    logger.info("Triggers for 'production_summary' created or already exist.")
+
+    conn.commit()
+    print("Migration 007 applied successfully.")
@@ -0,0 +1,24 @@
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(conn: sqlite3.Connection):
+    """
+    バージョン8へのアップグレード。
+    - 数量が不整合な生産実績（指図数量 - 累計数量 != 残数量）だけを含む部分インデックスを作成する。
+      不整合チェックはテーブル全体を走査せず、このインデックスに載っている行だけを読む。
+      条件式は ProductionAnalytics.find_quantity_inconsistencies のWHERE句と同じ形にしておく必要がある。
+    """
+    logger.info("Applying migration 008: Create partial index for quantity inconsistencies...")
+    cursor = conn.cursor()
+
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_production_records_quantity_inconsistent
+    ON production_records (id)
+    WHERE (order_quantity - cumulative_quantity) != remaining_quantity;
+    """)
+    logger.info("Index 'idx_production_records_quantity_inconsistent' created or already exists.")
+
+    conn.commit()
+    print("Migration 008 applied successfully.")
@@ -0,0 +1,4 @@
+"""
+データベースのマイグレーションスクリプト。
+`NNN_説明.py` の形式で、各モジュールが `upgrade(conn)` を持つ。適用は src.models.migration_manager が行う。
+"""
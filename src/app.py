@@ -4,8 +4,8 @@ import datetime
 import altair as alt
 import sys
 
-from src.models.database import get_db_connection
-from src.utils.report_helpers import get_week_of_month, get_mrp_type
+from src.models.db_pool import get_thread_connection, release_thread_connection
+from src.utils.report_helpers import get_week_of_month_series, get_mrp_type_series
 from src.core.analytics import ErrorDetection, InventoryAnalysis, WipAnalysis, PcStockAnalysis
 from src.config import settings
 
@@ -17,11 +17,11 @@ def load_and_prepare_data():
     DBからデータをロードし、前処理と分析列の追加を行う。
     この関数は1時間キャッシュされ、2回目以降の実行は高速です。
     """
-    conn = get_db_connection()
+    conn = get_thread_connection()
     try:
         df = pd.read_sql_query("SELECT * FROM production_records", conn)
     finally:
-        conn.close()
+        release_thread_connection(conn)
 
     # --- データ型変換とクリーンアップ ---
     df['input_datetime'] = pd.to_datetime(df['input_datetime'], errors='coerce')
@@ -36,10 +36,10 @@ def load_and_prepare_data():
     # PC始まりのMRP管理者のみを対象とする
     df = df[df['mrp_controller'].str.startswith('PC', na=False)].copy()
 
-    df['week_category'] = df['completion_date'].apply(
-        lambda d: get_week_of_month(d) if pd.notna(d) else None
-    )
-    df['mrp_type'] = df['mrp_controller'].apply(get_mrp_type)
+    # 週区分は行ごとの関数呼び出しではなく列全体で計算する（input_datetimeの欠損行は除外済み）
+    df['week_category'] = get_week_of_month_series(df['input_datetime'])
+    # 内製/外注の判定も列全体で行い、集計キーとして使うためカテゴリ型で持つ
+    df['mrp_type'] = get_mrp_type_series(df['mrp_controller'])
 
     return df
 
@@ -156,11 +156,11 @@ def main():
         col1, col2 = st.columns([2, 1])
         with col1:
             st.subheader(f"{agg_label}の時系列推移")
-            time_series_df = filtered_df.groupby(['completion_date', 'mrp_type'])[agg_column].sum().unstack().fillna(0)
+            time_series_df = filtered_df.groupby(['completion_date', 'mrp_type'], observed=True)[agg_column].sum().unstack().fillna(0)
             st.line_chart(time_series_df)
         with col2:
             st.subheader(f"内製/外注の構成比 ({agg_label}ベース)")
-            mrp_type_summary = filtered_df.groupby('mrp_type')[agg_column].sum().reset_index()
+            mrp_type_summary = filtered_df.groupby('mrp_type', observed=True)[agg_column].sum().reset_index()
             mrp_type_summary['percentage'] = (mrp_type_summary[agg_column] / mrp_type_summary[agg_column].sum())
             base = alt.Chart(mrp_type_summary).encode(
                 theta=alt.Theta(field=agg_column, type="quantitative", stack=True),
@@ -204,7 +204,7 @@ def main():
         st.header("週別サマリーレポート")
 
         st.subheader("内製/外注別")
-        weekly_summary_type = filtered_df.groupby(['week_category', 'mrp_type'])[agg_column].sum().unstack(fill_value=0)
+        weekly_summary_type = filtered_df.groupby(['week_category', 'mrp_type'], observed=True)[agg_column].sum().unstack(fill_value=0)
         weekly_summary_type['合計'] = weekly_summary_type.sum(axis=1)
         total_row_type = weekly_summary_type.sum()
         total_row_type.name = '合計'
@@ -225,7 +225,7 @@ def main():
         st.header("仕掛進捗分析")
         st.info("全仕掛データと、完了（TECO/DLV）を除いた残高データを「仕掛年齢」別に比較します。")
 
-        conn = get_db_connection()
+        conn = get_thread_connection()
         try:
             wip_analyzer = WipAnalysis(conn)
             wip_comparison_df = wip_analyzer.get_wip_summary_comparison()
@@ -263,13 +263,13 @@ def main():
             else:
                 st.warning("表示する仕掛データがありません。`--sync-wip`コマンドでデータを同期してください。")
         finally:
-            conn.close()
+            release_thread_connection(conn)
 
     with tab_pc_stock:
         st.header("PC関連 在庫分析")
         st.info("棚卸報告区分が「3_PC」の工場在庫について、滞留状況を分析します。")
 
-        conn = get_db_connection()
+        conn = get_thread_connection()
         try:
             pc_stock_analyzer = PcStockAnalysis(conn)
 
@@ -312,11 +312,11 @@ def main():
             else:
                 st.warning("表示するPC在庫データがありません。`--sync-wip`コマンドでデータを同期してください。")
         finally:
-            conn.close()
+            release_thread_connection(conn)
 
     with tab_errors:
         st.header("データ整合性チェックレポート")
-        conn = get_db_connection()
+        conn = get_thread_connection()
         try:
             error_detector = ErrorDetection(conn)
 
@@ -340,13 +340,13 @@ def main():
             else:
                 st.success("未登録品目エラーは見つかりませんでした。")
         finally:
-            conn.close()
+            release_thread_connection(conn)
 
     with tab_db_viewer:
         st.header("データベースビューア")
         st.info("データベース内のテーブルを選択して、最初の200件のデータを表示します。")
 
-        conn = get_db_connection()
+        conn = get_thread_connection()
         try:
             # DBに存在するテーブルのリストを取得
             cursor = conn.cursor()
@@ -369,7 +369,7 @@ def main():
                     except Exception as e:
                         st.error(f"テーブルデータの読み込み中にエラーが発生しました: {e}")
         finally:
-            conn.close()
+            release_thread_connection(conn)
 
 
 if __name__ == "__main__":
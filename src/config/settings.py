@@ -8,6 +8,7 @@ LOGS_DIR = ROOT_DIR / "logs"
 REPORTS_DIR = ROOT_DIR / "reports"
 SRC_DIR = ROOT_DIR / "src"
 SAMPLE_DATA_DIR = DATA_DIR / "sample"
+CACHE_DIR = DATA_DIR / "cache"
 
 # 2. --- Database ---
 DB_DIR = DATA_DIR / "sqlite"
@@ -46,6 +47,7 @@ DB_DIR.mkdir(parents=True, exist_ok=True)
 LOGS_DIR.mkdir(parents=True, exist_ok=True)
 REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 SAMPLE_DATA_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 def check_network_file_access():
     """本番ファイルへのアクセス可能性をチェック"""
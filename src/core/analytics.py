@@ -26,13 +26,26 @@ class ProductionAnalytics:
     def get_summary(self) -> Dict[str, Any]:
         """
         生産実績の全体サマリー（計画、実績、達成率）を計算して返す。
+        件数と数量の合計は、挿入時にトリガーで更新される production_summary テーブルから読むため、
+        production_records の全件を走査しない。
 
         :return: サマリー情報を含む辞書
         """
         try:
-            df = pd.read_sql_query("SELECT order_quantity, actual_quantity FROM production_records", self.db_conn)
+            cursor = self.db_conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='production_summary';")
+            if cursor.fetchone() is not None:
+                cursor.execute(
+                    "SELECT record_count, total_order_quantity, total_actual_quantity FROM production_summary WHERE id = 1"
+                )
+            else:
+                # マイグレーション未適用のデータベースでは、production_records から集計する
+                cursor.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(order_quantity), 0), COALESCE(SUM(actual_quantity), 0) FROM production_records"
+                )
+            row = cursor.fetchone()
 
-            if df.empty:
+            if row is None or row[0] == 0:
                 return {
                     "total_order_quantity": 0,
                     "total_actual_quantity": 0,
@@ -40,8 +53,7 @@ class ProductionAnalytics:
                     "record_count": 0
                 }
 
-            total_order_quantity = df['order_quantity'].sum()
-            total_actual_quantity = df['actual_quantity'].sum()
+            record_count, total_order_quantity, total_actual_quantity = row
 
             if total_order_quantity > 0:
                 achievement_rate = (total_actual_quantity / total_order_quantity) * 100
@@ -52,7 +64,7 @@ class ProductionAnalytics:
                 "total_order_quantity": int(total_order_quantity),
                 "total_actual_quantity": int(total_actual_quantity),
                 "achievement_rate": round(achievement_rate, 2),
-                "record_count": len(df)
+                "record_count": int(record_count)
             }
         except Exception as e:
             logger.error(f"生産サマリーの分析中にエラーが発生しました: {e}", exc_info=True)
@@ -80,6 +92,7 @@ class ErrorDetection:
         :return: 数量が不整合なレコードを含むDataFrame
         """
         try:
+            # WHERE句はマイグレーション008の部分インデックスの条件と同じ式にして、インデックスだけを走査させる
             query = """
             SELECT
                 id,
@@ -1,80 +1,243 @@
+import csv
+import glob
 import logging
+import queue
+import re
+import threading
+import numpy as np
 import pandas as pd
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
 import sqlite3
 
 from pydantic import ValidationError
-from src.models.production import ProductionRecord
-from src.models.database import insert_production_records
+from src.models.production import (
+    ProductionRecord, PRODUCTION_RECORDS_ADAPTER,
+    clean_sap_number, empty_str_to_none, parse_planned_completion_date,
+)
+from src.models.database import PRODUCTION_RECORD_COLUMNS, insert_production_records_from_df, invalidate_data_file_processed
+from src.config import settings
 
 logger = logging.getLogger(__name__)
 
+# pyarrowは任意の依存。あれば生産実績ファイルの読み込みに使い、
+# 解析済み品目マスターのキャッシュもParquetで保存する（なければpickle）。
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    MASTER_CACHE_SUFFIX = '.parquet'
+except ImportError:
+    pa = pacsv = None
+    MASTER_CACHE_SUFFIX = '.pkl'
+
+# 生産実績ファイルの数値列。読み込み時にCパーサーで直接floatへ変換する。
+PRODUCTION_NUMERIC_COLS = ['指図数量', '実績数量', '累計数量', '残数量']
+# 数値列以外は、品目コード等が数値に推論されないよう文字列で読み込む
+PRODUCTION_READ_DTYPES = defaultdict(lambda: str, {col: 'float64' for col in PRODUCTION_NUMERIC_COLS})
+
+# この大きさ以上の生産実績ファイルは、チャンク単位の読み込み・検証とDBへの挿入を並行して行う
+PRODUCTION_PIPELINE_MIN_BYTES = 64 * 1024 * 1024
+PRODUCTION_PIPELINE_CHUNK_ROWS = 50_000
+# 読み込み側のスレッドが先行してよいチャンク数。メモリに保持するチャンクの上限になる
+PRODUCTION_PIPELINE_QUEUE_SIZE = 4
+_PIPELINE_END = object()
+
+# DB挿入用の列変換。ProductionRecordのバリデータと同じ規則をDataFrame全体にまとめて適用する。
+_FIELD_ALIASES = {name: field.alias for name, field in ProductionRecord.model_fields.items()}
+_REQUIRED_TEXT_FIELDS = ['plant', 'item_code', 'item_text', 'order_number', 'order_type', 'mrp_controller']
+_QUANTITY_FIELDS = ['order_quantity', 'actual_quantity', 'cumulative_quantity', 'remaining_quantity']
+_BLANK_TO_NONE_FIELDS = ['storage_location', 'wbs_element']
+_SAP_NUMBER_FIELDS = ['sales_order_number', 'sales_order_item_number']
+
+def _as_optional_text(value):
+    """モデルのOptional[str]の列と同じく、文字列とNone以外の値を不正とする。"""
+    if value is not None and not isinstance(value, str):
+        raise TypeError(f"'{value}' is not a string.")
+    return value
+
+def _blank_to_none_text(value):
+    return _as_optional_text(empty_str_to_none(value))
+
+def _clean_sap_number_text(value):
+    return _as_optional_text(clean_sap_number(value))
+
+def _planned_completion_date_text(value):
+    parsed = parse_planned_completion_date(value)
+    return parsed.isoformat() if parsed is not None else None
+
+def _apply_to_unique_values(series: pd.Series, func) -> Tuple[pd.Series, pd.Series]:
+    """
+    列のユニークな値だけにfuncを適用して各行に割り当て、変換後の列と、funcが失敗した行のマスクを返す。
+    欠損値（None）はfuncに渡さず、Noneのままとする。
+    """
+    codes, uniques = pd.factorize(series)
+    values, failed = [], []
+    for value in uniques:
+        try:
+            values.append(func(value))
+            failed.append(False)
+        except (ValueError, TypeError):
+            values.append(None)
+            failed.append(True)
+    # 欠損値のコード(-1)は末尾の要素を指す
+    values.append(None)
+    failed.append(False)
+    value_array = np.empty(len(values), dtype=object)
+    value_array[:] = values
+    return (
+        pd.Series(value_array[codes], index=series.index, name=series.name),
+        pd.Series(np.array(failed)[codes], index=series.index),
+    )
+
 class DataProcessor:
     """
     データファイルの処理、加工、データベースへのロードを担当するクラス。
     """
-    def __init__(self, db_conn: sqlite3.Connection):
+    def __init__(self, db_conn: sqlite3.Connection, strict: bool = False):
+        """
+        :param strict: Trueの場合、DBへ挿入する行をDataFrameの一括変換ではなく
+                       ProductionRecordモデルで検証する（低速だが検証はモデル定義そのもの）
+        """
         self.db_conn = db_conn
+        self.strict = strict
         self.final_df = pd.DataFrame()
 
-    def _load_item_master_from_db(self) -> pd.DataFrame:
+    def _load_item_master_from_db(self) -> Dict[str, float]:
+        """
+        品目マスターを {品目コード: 標準原価} の辞書として読み込む。
+        金額付与では単価の引き当てにしか使わないため、DataFrameは作らない。
+        """
         try:
             query = "SELECT name FROM sqlite_master WHERE type='table' AND name='item_master';"
             cursor = self.db_conn.cursor()
             cursor.execute(query)
             if cursor.fetchone() is None:
-                return pd.DataFrame()
-            master_df = pd.read_sql_query("SELECT item_code, standard_cost FROM item_master", self.db_conn)
-            master_df.set_index('item_code', inplace=True)
-            return master_df
+                return {}
+            cursor.execute("SELECT item_code, standard_cost FROM item_master")
+            return {item_code: standard_cost for item_code, standard_cost in cursor.fetchall()}
         except Exception as e:
             logger.error(f"DBからの品目マスター読み込み中にエラーが発生しました: {e}")
-            return pd.DataFrame()
+            return {}
 
-    def sync_master_from_csv(self, master_path: Path):
-        logger.info(f"品目マスターの同期（洗い替え）を開始します: {master_path}")
+    def _master_cache_path(self, master_path: Path) -> Path:
+        """
+        マスターファイルの更新日時とサイズをキーにした、解析済みマスターのキャッシュファイルのパス。
+        更新日時を保ったままコピーされたファイル（robocopy等）でも、サイズが変われば別のキャッシュになる。
+        """
+        stat = master_path.stat()
+        return settings.CACHE_DIR / f"{master_path.stem}.{stat.st_mtime_ns}.{stat.st_size}{MASTER_CACHE_SUFFIX}"
+
+    def _read_master_cache(self, cache_path: Path) -> Optional[pd.DataFrame]:
+        if not cache_path.exists():
+            return None
+        try:
+            if MASTER_CACHE_SUFFIX == '.parquet':
+                return pd.read_parquet(cache_path)
+            return pd.read_pickle(cache_path)
+        except Exception as e:
+            logger.warning(f"品目マスターのキャッシュを読み込めなかったため、CSVから読み込みます: {cache_path}, {e}")
+            return None
+
+    def _write_master_cache(self, master_path: Path, cache_path: Path, master_df: pd.DataFrame):
         try:
-            # MARA_DL.csvを読み込む。エンコードはUTF-16、セパレータは自動判別。
-            # usecolsは指定せず、全列を読み込んでから処理する。
+            # 同じマスターファイルの古いキャッシュは削除する。ファイル名に'.'を含む別のマスターのキャッシュ
+            # （例: MARA_DL.csv に対する MARA_DL.old.csv）を消さないよう、"<stem>.<更新日時>.<サイズ>" の形のものだけを対象にする
+            stale_name = re.compile(re.escape(master_path.stem) + r'\.\d+\.\d+' + re.escape(MASTER_CACHE_SUFFIX))
+            for stale_path in cache_path.parent.glob(f"{glob.escape(master_path.stem)}.*{MASTER_CACHE_SUFFIX}"):
+                if stale_path != cache_path and stale_name.fullmatch(stale_path.name):
+                    stale_path.unlink(missing_ok=True)
+            if MASTER_CACHE_SUFFIX == '.parquet':
+                master_df.to_parquet(cache_path, index=False)
+            else:
+                master_df.to_pickle(cache_path)
+        except Exception as e:
+            logger.warning(f"品目マスターのキャッシュを書き込めませんでした: {cache_path}, {e}")
+
+    def _sniff_master_delimiter(self, master_path: Path) -> Optional[str]:
+        """
+        マスターファイルの最初の空でない行から区切り文字を判別する（pandasのsep=Noneと同じ判定）。
+        判別できない場合はNoneを返す。
+        """
+        with open(master_path, encoding='utf-16', newline='') as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        return csv.Sniffer().sniff(line).delimiter
+                    except csv.Error:
+                        return None
+        return None
+
+    def _parse_master_csv(self, master_path: Path) -> Optional[pd.DataFrame]:
+        # MARA_DL.csvを読み込む。エンコードはUTF-16、セパレータは自動判別。
+        # usecolsは指定せず、全列を読み込んでから処理する。
+        # 品目コードは数値に推論されないよう文字列で読み込む。
+        # 標準原価はDBへ丸め誤差を持ち込まないよう、ここでは float64 のまま保持する。
+        sep = self._sniff_master_delimiter(master_path)
+        if sep is not None:
+            # 区切り文字が分かれば、Pythonエンジンより高速なCパーサーで読み込む
+            master_df = pd.read_csv(master_path, sep=sep, encoding='utf-16', dtype={'品目': str})
+        else:
             master_df = pd.read_csv(
                 master_path, sep=None, engine='python',
-                encoding='utf-16'
+                encoding='utf-16', dtype={'品目': str}
             )
 
-            # P100プラントでフィルタ（列が存在する場合のみ）
-            if 'プラント' in master_df.columns:
-                initial_count = len(master_df)
-                master_df = master_df[master_df['プラント'] == 'P100'].copy()
-                logger.info(f"P100プラントでフィルタリング: {initial_count}件 → {len(master_df)}件")
-            else:
-                logger.warning("マスターファイルに 'プラント' 列が見つからないため、フィルタリングをスキップします。")
+        # 列名の存在確認は集合で一度に行う
+        cols = frozenset(master_df.columns)
 
-            # 必要な列が存在するか確認
-            required_cols = {'品目': 'item_code', '標準原価': 'standard_cost'}
-            if not all(col in master_df.columns for col in required_cols.keys()):
-                logger.error(f"マスターファイルに必要な列 {list(required_cols.keys())} がありません。")
-                return
+        # P100プラントでフィルタ（列が存在する場合のみ）
+        if 'プラント' in cols:
+            initial_count = len(master_df)
+            master_df = master_df[master_df['プラント'] == 'P100'].copy()
+            logger.info(f"P100プラントでフィルタリング: {initial_count}件 → {len(master_df)}件")
+        else:
+            logger.warning("マスターファイルに 'プラント' 列が見つからないため、フィルタリングをスキップします。")
 
-            master_df.rename(columns=required_cols, inplace=True)
+        # 必要な列が存在するか確認
+        required_cols = {'品目': 'item_code', '標準原価': 'standard_cost'}
+        if not cols.issuperset(required_cols):
+            logger.error(f"マスターファイルに必要な列 {list(required_cols.keys())} がありません。")
+            return None
 
-            if 'item_code' in master_df.columns:
-                master_df['item_code'] = master_df['item_code'].str.strip()
+        master_df.rename(columns=required_cols, inplace=True)
+        master_df['item_code'] = master_df['item_code'].str.strip()
 
-            initial_rows = len(master_df)
-            master_df.drop_duplicates(subset=['item_code'], keep='last', inplace=True)
-            if initial_rows > len(master_df):
-                logger.warning(f"CSVマスター内で{initial_rows - len(master_df)}件の重複を検出し、最新のデータで上書きしました。")
+        initial_rows = len(master_df)
+        master_df.drop_duplicates(subset=['item_code'], keep='last', inplace=True)
+        if initial_rows > len(master_df):
+            logger.warning(f"CSVマスター内で{initial_rows - len(master_df)}件の重複を検出し、最新のデータで上書きしました。")
 
-            # DBテーブルに存在する列のみに絞り込む
-            cols_to_insert = ['item_code', 'standard_cost']
-            final_master_df = master_df[cols_to_insert]
+        # DBテーブルに存在する列のみに絞り込む
+        cols_to_insert = ['item_code', 'standard_cost']
+        return master_df[cols_to_insert].reset_index(drop=True)
+
+    def sync_master_from_csv(self, master_path: Path):
+        logger.info(f"品目マスターの同期（洗い替え）を開始します: {master_path}")
+        try:
+            # マスターファイルが前回から更新されていなければ、解析済みのキャッシュを使う
+            cache_path = self._master_cache_path(master_path)
+            final_master_df = self._read_master_cache(cache_path)
+            if final_master_df is not None:
+                logger.info(f"解析済みの品目マスターキャッシュを使用します: {cache_path}")
+            else:
+                final_master_df = self._parse_master_csv(master_path)
+                if final_master_df is None:
+                    return
+                self._write_master_cache(master_path, cache_path, final_master_df)
 
             cursor = self.db_conn.cursor()
             logger.info("既存の品目マスターデータを削除します...")
             cursor.execute("DELETE FROM item_master;")
             logger.info("CSVから新しい品目マスターデータを挿入します...")
-            final_master_df.to_sql('item_master', self.db_conn, if_exists='append', index=False)
+            # to_sqlを経由せず、タプルを直接executemanyに渡して一括挿入する
+            cursor.executemany(
+                "INSERT INTO item_master (item_code, standard_cost) VALUES (?, ?)",
+                final_master_df.itertuples(index=False, name=None)
+            )
+            # 同じ生産実績ファイルでも、新しい標準原価で金額とレポートを作り直させる
+            invalidate_data_file_processed(self.db_conn)
             self.db_conn.commit()
             logger.info(f"品目マスターの同期が完了しました。{len(final_master_df)}件のレコードを処理しました。")
         except FileNotFoundError:
@@ -83,35 +246,52 @@ class DataProcessor:
             logger.error(f"品目マスターの同期中にエラーが発生しました: {e}", exc_info=True)
 
 
-    def _load_production_dataframe(self, file_path: Path) -> pd.DataFrame:
-        try:
-            df = pd.read_csv(
-                file_path, encoding='shift_jis', sep='\t',
-                dtype=str, skiprows=0, encoding_errors='replace'
-            )
-            df.columns = df.columns.str.strip()
-            df = df.where(pd.notna(df), None)
-
-            if '品目コード' in df.columns:
-                df['品目コード'] = df['品目コード'].str.strip()
+    def _read_production_csv(self, file_path: Path, dtype) -> pd.DataFrame:
+        if pacsv is not None:
+            return self._read_production_csv_arrow(file_path, dtype)
+        return pd.read_csv(
+            file_path, encoding='shift_jis', sep='\t',
+            dtype=dtype, skiprows=0, encoding_errors='replace'
+        )
 
-            original_rows = len(df)
-            if 'MRP管理者' in df.columns:
-                df = df[df['MRP管理者'].str.startswith('PC', na=False)].copy()
-                logger.info(f"MRP管理者フィルタを適用: {original_rows}行 -> {len(df)}行")
+    def _read_production_csv_arrow(self, file_path: Path, dtype) -> pd.DataFrame:
+        """
+        pyarrowのマルチスレッドCSVパーサーで読み込む。数値列の変換もパーサー内で行う。
+        pyarrowはShift_JISを直接読めないため、メモリ上でUTF-8に変換してから渡す。
+        """
+        text = Path(file_path).read_bytes().decode('shift_jis', errors='replace')
+        if not text.strip():
+            raise pd.errors.EmptyDataError("No columns to parse from file")
 
-            if '入力日時' in df.columns:
-                df['入力日時'] = pd.to_datetime(df['入力日時'], format='%Y/%m/%d %H:%M', errors='coerce')
-                df.dropna(subset=['入力日時'], inplace=True)
-                df['入力日時'] = df['入力日時'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        # 列の型はpandasで読む場合と同じく、数値列以外はすべて文字列とする
+        # （dtype[col]で参照するとdefaultdictに全列が追加されるため、getで参照する）
+        header = text.split('\n', 1)[0].rstrip('\r').split('\t')
+        column_types = {
+            col: pa.float64() if dtype is not str and dtype.get(col, str) == 'float64' else pa.string()
+            for col in header
+        }
+        # 数値に変換できない値があるとArrowInvalid（ValueErrorのサブクラス）が送出され、
+        # 呼び出し元で文字列としての再読み込みに切り替わる
+        table = pacsv.read_csv(
+            pa.py_buffer(text.encode('utf-8')),
+            parse_options=pacsv.ParseOptions(delimiter='\t'),
+            convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+        )
+        return table.to_pandas(self_destruct=True, split_blocks=True)
 
-            numeric_cols = ['指図数量', '実績数量', '累計数量', '残数量']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-
-            df = df.where(pd.notna(df), None)
-            return df
+    def _load_production_dataframe(self, file_path: Path) -> pd.DataFrame:
+        try:
+            try:
+                df = self._read_production_csv(file_path, PRODUCTION_READ_DTYPES)
+                needs_numeric_coercion = False
+            except pd.errors.EmptyDataError:
+                raise
+            except ValueError as e:
+                # 数値列に数値以外の値が含まれる場合は、文字列で読み直してから行単位で欠損に変換する
+                logger.warning(f"数値列の型指定読み込みに失敗したため、文字列として再読み込みします: {e}")
+                df = self._read_production_csv(file_path, str)
+                needs_numeric_coercion = True
+            return self._prepare_production_frame(df, needs_numeric_coercion)
         except FileNotFoundError:
             logger.error(f"ファイルが見つかりません: {file_path}")
             raise
@@ -122,32 +302,102 @@ class DataProcessor:
             logger.error(f"ファイルの読み込み中に予期せぬエラーが発生しました: {e}")
             raise
 
-    def _enrich_data(self, prod_df: pd.DataFrame, master_df: pd.DataFrame) -> pd.DataFrame:
-        if master_df.empty:
+    def _iter_production_chunks(self, file_path: Path, chunk_rows: int):
+        """
+        生産実績ファイルをchunk_rows行ずつ読み込み、読み込み直後の加工を済ませたDataFrameを順に返す。
+        途中のチャンクで数値列の変換に失敗しても読み直せないため、全列を文字列で読んでから数値に変換する。
+        """
+        try:
+            reader = pd.read_csv(
+                file_path, encoding='shift_jis', sep='\t', dtype=str,
+                encoding_errors='replace', chunksize=chunk_rows
+            )
+        except pd.errors.EmptyDataError:
+            logger.warning(f"データファイルが空です: {file_path}")
+            return
+        with reader:
+            for chunk in reader:
+                yield self._prepare_production_frame(chunk, needs_numeric_coercion=True)
+
+    def _prepare_production_frame(self, df: pd.DataFrame, needs_numeric_coercion: bool) -> pd.DataFrame:
+        """読み込んだ生産実績の列名・品目コードの整形、MRP管理者での絞り込み、日時・数値の変換を行う。"""
+        df.columns = df.columns.str.strip()
+        cols = frozenset(df.columns)
+
+        if '品目コード' in cols:
+            df['品目コード'] = df['品目コード'].str.strip()
+
+        original_rows = len(df)
+        if 'MRP管理者' in cols:
+            df = df[df['MRP管理者'].str.startswith('PC', na=False)].copy()
+            logger.info(f"MRP管理者フィルタを適用: {original_rows}行 -> {len(df)}行")
+
+        if '入力日時' in cols:
+            df['入力日時'] = pd.to_datetime(df['入力日時'], format='%Y/%m/%d %H:%M', errors='coerce')
+            df.dropna(subset=['入力日時'], inplace=True)
+            df['入力日時'] = df['入力日時'].dt.strftime('%Y-%m-%d %H:%M:%S')
+
+        if needs_numeric_coercion:
+            numeric_cols_present = [col for col in PRODUCTION_NUMERIC_COLS if col in cols]
+            for col in numeric_cols_present:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+
+        # 欠損値のNone化は、行の絞り込みと型変換がすべて終わった後に一度だけ行う
+        df = df.where(pd.notna(df), None)
+        return df
+
+    def _enrich_data(self, prod_df: pd.DataFrame, item_costs: Dict[str, float]) -> pd.DataFrame:
+        if not item_costs:
             logger.warning("品目マスターが空のため、金額計算をスキップします。")
             prod_df['amount'] = 0.0
             return prod_df
 
-        prod_df_temp = prod_df.rename(columns={'品目コード': 'item_code'})
+        # 読み込んだフレームはこの処理専用のものなので、コピーを作らずにそのまま列を追加する
+        enriched_df = prod_df
+        enriched_df.reset_index(drop=True, inplace=True)
 
-        enriched_df = pd.merge(prod_df_temp, master_df, on='item_code', how='left')
+        # 品目コードはカテゴリ型（辞書エンコード）にしておき、単価の引き当ては
+        # 結合ではなく辞書に対するSeries.mapで行う（カテゴリ型のmapはユニークな品目コードのみを引き当てる）
+        enriched_df['品目コード'] = enriched_df['品目コード'].astype('category')
+        # 標準原価・実績数量は float64 のまま掛け合わせる（float32にすると0.7のような単価の下位の桁が失われ、
+        # 整数に切り捨てるレポートの金額が1円ずれる）
+        enriched_df['standard_cost'] = pd.to_numeric(
+            enriched_df['品目コード'].map(item_costs).astype('float64'), errors='coerce'
+        )
 
         enriched_df['実績数量'] = pd.to_numeric(enriched_df['実績数量'], errors='coerce')
-        enriched_df['standard_cost'] = pd.to_numeric(enriched_df['standard_cost'], errors='coerce')
         enriched_df['amount'] = enriched_df['実績数量'] * enriched_df['standard_cost']
 
-        missing_cost_count = enriched_df['amount'].isna().sum()
+        # 欠損マスクは一度だけ計算し、ログ出力と0埋めで使い回す
+        missing_mask = enriched_df['amount'].isna()
+        missing_cost_count = int(missing_mask.sum())
         if missing_cost_count > 0:
-            missing_items = enriched_df[enriched_df['amount'].isna()]['item_code'].unique()
-            logger.warning(f"{missing_cost_count}件のレコードで標準原価が見つからず、金額を0に設定しました。対象品目: {list(missing_items)}")
-            enriched_df['amount'].fillna(0, inplace=True)
+            if logger.isEnabledFor(logging.WARNING):
+                missing_items = enriched_df.loc[missing_mask, '品目コード'].unique()
+                logger.warning("%d件のレコードで標準原価が見つからず、金額を0に設定しました。対象品目: %s",
+                               missing_cost_count, list(missing_items))
+            enriched_df.loc[missing_mask, 'amount'] = 0.0
 
-        enriched_df.rename(columns={'item_code': '品目コード'}, inplace=True)
         return enriched_df
 
     def _validate_and_transform_data(self, df: pd.DataFrame) -> Tuple[List[ProductionRecord], List[Dict[str, Any]]]:
-        valid_records, invalid_records = [], []
-        for record_dict in df.to_dict(orient='records'):
+        # to_dict(orient='records')のセル単位のボックス化を避け、列ごとにtolist()で一括変換してから行にまとめる
+        columns = list(df.columns)
+        records = [dict(zip(columns, row)) for row in zip(*(df[col].tolist() for col in columns))]
+        # まず全行を1回の呼び出しでまとめて検証する（pydantic-core内で処理される）
+        try:
+            return PRODUCTION_RECORDS_ADAPTER.validate_python(records), []
+        except ValidationError as e:
+            invalid_indices = sorted({error['loc'][0] for error in e.errors()})
+
+        # 失敗した行を除いて再度まとめて検証し、失敗した行だけ個別にエラー内容を取得する
+        invalid_index_set = set(invalid_indices)
+        valid_records = PRODUCTION_RECORDS_ADAPTER.validate_python(
+            [record for i, record in enumerate(records) if i not in invalid_index_set]
+        )
+        invalid_records = []
+        for i in invalid_indices:
+            record_dict = records[i]
             try:
                 valid_records.append(ProductionRecord(**record_dict))
             except ValidationError as e:
@@ -155,28 +405,217 @@ class DataProcessor:
                 invalid_records.append({'data': record_dict, 'errors': e.errors()})
         return valid_records, invalid_records
 
+    def _to_insert_frame(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+        """
+        金額付与済みのDataFrameを、production_recordsへの挿入列に揃えたDataFrameに変換する。
+        行ごとにProductionRecordを生成せず、バリデータと同じ変換・検証を列単位で行う。
+        検証に失敗した行は除外し、エラー内容とともに返す。
+        """
+        frame = df.rename(columns={alias: name for name, alias in _FIELD_ALIASES.items()})
+        frame = frame.reindex(columns=list(PRODUCTION_RECORD_COLUMNS))
+        text_fields = _REQUIRED_TEXT_FIELDS + _BLANK_TO_NONE_FIELDS + _SAP_NUMBER_FIELDS + ['input_datetime', 'planned_completion_date']
+        frame[text_fields] = frame[text_fields].astype(object)
+
+        errors = {}
+        for field in _REQUIRED_TEXT_FIELDS + ['input_datetime']:
+            errors[field] = frame[field].isna()
+
+        for field in _QUANTITY_FIELDS:
+            values = pd.to_numeric(frame[field], errors='coerce').astype('float64')
+            is_whole = np.isfinite(values) & (values == np.floor(values))
+            errors[field] = ~is_whole
+            frame[field] = values.where(is_whole).astype('Int64')
+
+        # 独自のバリデータを持つ列は、ProductionRecordと同じ関数を列のユニークな値に適用する
+        for field in _BLANK_TO_NONE_FIELDS:
+            frame[field], errors[field] = _apply_to_unique_values(frame[field], _blank_to_none_text)
+        for field in _SAP_NUMBER_FIELDS:
+            frame[field], errors[field] = _apply_to_unique_values(frame[field], _clean_sap_number_text)
+        frame['planned_completion_date'], errors['planned_completion_date'] = _apply_to_unique_values(
+            frame['planned_completion_date'], _planned_completion_date_text
+        )
+
+        error_df = pd.DataFrame(errors)
+        invalid_mask = error_df.any(axis=1)
+        invalid_records = []
+        if invalid_mask.any():
+            for idx, flags in error_df[invalid_mask].iterrows():
+                record_dict = df.loc[idx].to_dict()
+                record_errors = [
+                    {'loc': (_FIELD_ALIASES[field],), 'msg': '値が欠損しているか、形式が正しくありません。'}
+                    for field, failed in flags.items() if failed
+                ]
+                logger.warning(f"バリデーションエラー: {record_errors} | データ: {record_dict}")
+                invalid_records.append({'data': record_dict, 'errors': record_errors})
+
+        # 欠損値・numpyの数値の変換は挿入時（insert_production_records_from_df）にまとめて行う
+        insert_df = frame[~invalid_mask]
+        return insert_df, invalid_records
+
+    def _to_insert_frame_strict(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+        """
+        ProductionRecordモデルで検証してから挿入用のDataFrameを作る（--strict指定時）。
+        """
+        valid_records, invalid_records = self._validate_and_transform_data(df)
+        rows = [tuple(getattr(r, col) for col in PRODUCTION_RECORD_COLUMNS) for r in valid_records]
+        # datetime/dateはpandasの型に変換させず、Pythonオブジェクトのまま挿入する
+        insert_df = pd.DataFrame(rows, columns=list(PRODUCTION_RECORD_COLUMNS), dtype=object)
+        return insert_df, invalid_records
+
+    def _build_insert_frame(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+        if self.strict:
+            return self._to_insert_frame_strict(df)
+        return self._to_insert_frame(df)
+
+    def _insert_frame(self, insert_df: pd.DataFrame):
+        if insert_df.empty:
+            return
+        insert_production_records_from_df(self.db_conn, insert_df)
+        logger.info(f"{len(insert_df)}件の有効なレコードをデータベースに挿入しました。")
+
+    def ingest_to_db(self, enriched_df: pd.DataFrame) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        金額付与済みのDataFrameを検証し、有効な行をDataFrameの列から直接DBへ挿入する。
+        strictでなければPydanticモデルを経由しないため、行数分のモデル生成・展開が発生しない。
+
+        :return: 有効行数と、無効行のリスト
+        """
+        insert_df, invalid_records = self._build_insert_frame(enriched_df)
+        self._insert_frame(insert_df)
+        return len(insert_df), invalid_records
+
+    def to_records(self) -> List[ProductionRecord]:
+        """
+        直近に処理したデータをProductionRecordのリストとして返す。
+        モデルが必要な呼び出し元のためのもので、呼ばれた時だけバリデーションを行う。
+        """
+        if self.final_df.empty:
+            return []
+        valid_records, _ = self._validate_and_transform_data(self.final_df)
+        return valid_records
+
+    def _parse_file(self, data_path: Path, item_costs: Dict[str, float]):
+        """
+        1ファイル分の読み込み・金額付与・挿入用の変換を行う。DBへの書き込みは行わない。
+        """
+        prod_df = self._load_production_dataframe(data_path)
+        if prod_df.empty:
+            return prod_df, prod_df, []
+        enriched_df = self._enrich_data(prod_df, item_costs)
+        insert_df, invalid_records = self._build_insert_frame(enriched_df)
+        return self._narrow_dtypes(enriched_df), insert_df, invalid_records
+
+    def _narrow_dtypes(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        挿入用の検証が終わった後、final_dfとして保持する列を小さい型に変換する。
+        小数や欠損を含む数量列は、検証結果と表示を変えないよう元の型のまま残す。
+        """
+        int32_info = np.iinfo(np.int32)
+        for col in PRODUCTION_NUMERIC_COLS:
+            if col not in df.columns:
+                continue
+            values = pd.to_numeric(df[col], errors='coerce')
+            if values.notna().all() and (values % 1 == 0).all() and values.between(int32_info.min, int32_info.max).all():
+                df[col] = values.astype('int32')
+        if 'MRP管理者' in df.columns:
+            df['MRP管理者'] = df['MRP管理者'].astype('category')
+        return df
+
+    def _load_parsed_to_db(self, data_path: Path, enriched_df: pd.DataFrame,
+                           insert_df: pd.DataFrame, invalid_records: List[Dict[str, Any]]) -> dict:
+        self._insert_frame(insert_df)
+
+        summary = {
+            "file": str(data_path), "total_rows": len(enriched_df),
+            "successful_inserts": len(insert_df), "failed_rows": len(invalid_records)
+        }
+        logging.info(f"ファイル処理が完了しました: {summary}")
+        return summary
+
     def process_file_and_load_to_db(self, data_path: Path) -> dict:
         logging.info(f"ファイル処理を開始します: {data_path}")
         try:
-            prod_df = self._load_production_dataframe(data_path)
-            if prod_df.empty:
+            item_costs = self._load_item_master_from_db()
+            if Path(data_path).stat().st_size >= PRODUCTION_PIPELINE_MIN_BYTES:
+                return self._process_file_pipelined(data_path, item_costs)
+            enriched_df, insert_df, invalid_records = self._parse_file(data_path, item_costs)
+            if enriched_df.empty:
                 return {"file": str(data_path), "total_rows": 0, "successful_inserts": 0, "failed_rows": 0}
 
-            master_df = self._load_item_master_from_db()
-            enriched_df = self._enrich_data(prod_df, master_df)
-            valid_records, invalid_records = self._validate_and_transform_data(enriched_df)
-
-            if valid_records:
-                insert_production_records(self.db_conn, valid_records)
-                logger.info(f"{len(valid_records)}件の有効なレコードをデータベースに挿入しました。")
-
             self.final_df = enriched_df
-            summary = {
-                "file": str(data_path), "total_rows": len(enriched_df),
-                "successful_inserts": len(valid_records), "failed_rows": len(invalid_records)
-            }
-            logging.info(f"ファイル処理が完了しました: {summary}")
-            return summary
+            return self._load_parsed_to_db(data_path, enriched_df, insert_df, invalid_records)
         except Exception as e:
             logger.error(f"ファイル処理中にエラーが発生しました: {data_path}, Error: {e}", exc_info=True)
             return {"file": str(data_path), "status": "failed", "error": str(e)}
+
+    def _produce_insert_chunks(self, data_path: Path, item_costs: Dict[str, float], chunk_rows: int,
+                               chunk_queue: queue.Queue, stop: threading.Event):
+        """読み込み側のスレッド。チャンクごとに金額付与と挿入用の変換を行い、キューに渡す。"""
+        try:
+            for prod_df in self._iter_production_chunks(data_path, chunk_rows):
+                if stop.is_set():
+                    return
+                if prod_df.empty:
+                    continue
+                enriched_df = self._enrich_data(prod_df, item_costs)
+                insert_df, invalid_records = self._build_insert_frame(enriched_df)
+                chunk_queue.put((enriched_df, insert_df, invalid_records))
+        finally:
+            chunk_queue.put(_PIPELINE_END)
+
+    def _process_file_pipelined(self, data_path: Path, item_costs: Dict[str, float],
+                                chunk_rows: int = PRODUCTION_PIPELINE_CHUNK_ROWS) -> dict:
+        """
+        大きな生産実績ファイルを、読み込み・検証を行うスレッドと、DBへ挿入するこのスレッドに分けて処理する。
+        SQLiteの書き込みは直列化されるため、挿入は接続を持つこのスレッドだけが1つのトランザクションで行う。
+        """
+        chunk_queue = queue.Queue(maxsize=PRODUCTION_PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+        enriched_frames, invalid_records, inserted = [], [], 0
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            producer = executor.submit(self._produce_insert_chunks, data_path, item_costs, chunk_rows, chunk_queue, stop)
+            # 呼び出し元がトランザクションを開いている場合はその中で挿入し、コミット・ロールバックは呼び出し元に任せる
+            owns_transaction = not self.db_conn.in_transaction
+            try:
+                if owns_transaction:
+                    self.db_conn.execute("BEGIN IMMEDIATE")
+                while True:
+                    item = chunk_queue.get()
+                    if item is _PIPELINE_END:
+                        break
+                    enriched_df, insert_df, chunk_invalid = item
+                    if not insert_df.empty:
+                        insert_production_records_from_df(self.db_conn, insert_df, commit=False)
+                    enriched_frames.append(enriched_df)
+                    invalid_records.extend(chunk_invalid)
+                    inserted += len(insert_df)
+                # 読み込み側で発生した例外はここで送出される
+                producer.result()
+                if owns_transaction:
+                    self.db_conn.commit()
+            except BaseException:
+                if owns_transaction:
+                    self.db_conn.rollback()
+                # 読み込み側がキューへの追加で止まらないよう、終了するまでキューを空にする
+                stop.set()
+                while not producer.done():
+                    try:
+                        chunk_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                raise
+
+        if not enriched_frames:
+            return {"file": str(data_path), "total_rows": 0, "successful_inserts": 0, "failed_rows": 0}
+        logger.info(f"{inserted}件の有効なレコードをデータベースに挿入しました。")
+
+        enriched_df = pd.concat(enriched_frames, ignore_index=True)
+        if item_costs:
+            enriched_df['品目コード'] = enriched_df['品目コード'].astype('category')
+        self.final_df = self._narrow_dtypes(enriched_df)
+        summary = {
+            "file": str(data_path), "total_rows": len(enriched_df),
+            "successful_inserts": inserted, "failed_rows": len(invalid_records)
+        }
+        logging.info(f"ファイル処理が完了しました: {summary}")
+        return summary
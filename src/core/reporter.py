@@ -1,12 +1,67 @@
 import pandas as pd
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from src.utils.report_helpers import get_week_of_month
+from src.utils.report_helpers import get_week_of_month_series
 from src.config import settings
 
 logger = logging.getLogger(__name__)
 
+# レポートのCSV書き出しはpyarrowがあればそのCSVライターを使い、なければpandasのto_csvを使う
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+# 週区分（月の第1週～第6週）のカテゴリ型
+WEEK_CATEGORY_DTYPE = pd.CategoricalDtype(categories=range(1, 7), ordered=True)
+
+# レポート生成で参照する列。処理済みDataFrameからはこれらの列だけを取り出して保持する。
+REPORT_SOURCE_COLUMNS = [
+    'MRP管理者', '入力日時', '指図番号', '品目コード', '品目テキスト', '指図数量', '実績数量', 'amount'
+]
+
+def _write_report(report_df: pd.DataFrame, output_path: Path):
+    """
+    レポートをBOM付きUTF-8のタブ区切りファイルとして書き出す。
+    """
+    if pa is not None:
+        try:
+            # カテゴリ型は値そのものを書き出すため、辞書型ではなく元の値の列に戻してから変換する
+            category_cols = report_df.select_dtypes(include='category').columns
+            table = pa.Table.from_pandas(
+                report_df.astype({col: object for col in category_cols}), preserve_index=False
+            )
+            # pyarrowはヘッダー行を常に引用符で囲むため、ヘッダーはto_csvと同じ形式で自前で書く
+            write_options = pacsv.WriteOptions(delimiter='\t', include_header=False, quoting_style='none')
+            header = '\t'.join(str(col) for col in report_df.columns) + '\n'
+            with open(output_path, 'wb') as f:
+                # Excelで文字化けしないよう、to_csv(encoding='utf-8-sig')と同じくBOMを先頭に付ける
+                f.write(header.encode('utf-8-sig'))
+                pacsv.write_csv(table, f, write_options=write_options)
+            return
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+            # 区切り文字を含む値など、引用符なしで書けない場合はpandasで書き出す
+            logger.warning(f"pyarrowでのレポート書き出しに失敗したため、pandasで書き出します: {output_path}, {e}")
+    report_df.to_csv(output_path, sep='\t', index=False, encoding='utf-8-sig')
+
+QUANTITY_INCONSISTENCY_REPORT_NAME = "数量不整合.txt"
+
+def write_quantity_inconsistency_report(inconsistencies_df: pd.DataFrame):
+    """
+    数量の不整合レコードをレポートファイルに書き出し、そのパスを返す。
+    ログには件数とパスだけを出力できるよう、明細はファイルに直接書き出す。
+    不整合がなければ前回のファイルを削除し、Noneを返す。
+    """
+    output_path = settings.REPORTS_DIR / QUANTITY_INCONSISTENCY_REPORT_NAME
+    if inconsistencies_df.empty:
+        output_path.unlink(missing_ok=True)
+        return None
+    _write_report(inconsistencies_df, output_path)
+    return output_path
+
 class ReportGenerator:
     """
     分析データフレームから各種レポートを生成・出力するクラス。
@@ -18,8 +73,11 @@ class ReportGenerator:
 
         :param processed_df: データ処理済みのDataFrame
         """
-        self.df = processed_df.copy()
+        # 全列をコピーせず、レポートに必要な列だけの新しいフレームを作る（元のDataFrameは変更しない）
+        self.df = processed_df.filter(items=REPORT_SOURCE_COLUMNS)
         self.reports_dir = settings.REPORTS_DIR
+        # 週区分・完成日・MRP管理者別の金額集計（日別・週別サマリーで共用する）
+        self._daily_amounts = None
 
         # レポート生成に必要な列を追加
         self._add_report_columns()
@@ -36,21 +94,36 @@ class ReportGenerator:
         # '入力日時'から日付部分を抽出し、'完成日'を作成
         self.df['completion_date'] = self.df['入力日時'].dt.date
 
-        # '週区分'を計算
-        # dt.dateを適用できないNone値などがある場合を考慮
-        self.df['week_category'] = self.df['completion_date'].apply(
-            lambda d: get_week_of_month(d) if pd.notna(d) else None
-        )
+        # '週区分'を計算（行ごとの関数呼び出しではなく列全体で計算する）
+        self.df['week_category'] = get_week_of_month_series(self.df['入力日時'])
         logger.info("週区分列を追加しました。")
 
+        # 集計キーは値の種類が少ないため、カテゴリ型にして整数コードでgroupbyさせる
+        self.df['MRP管理者'] = self.df['MRP管理者'].astype('category')
+        self.df['week_category'] = self.df['week_category'].astype(WEEK_CATEGORY_DTYPE)
+
+    def _get_daily_amounts(self) -> pd.Series:
+        """
+        週区分・完成日・MRP管理者別の金額合計を返す。
+        self.dfに対するgroupbyは初回の1回だけ行い、週別の集計もこの結果から求める。
+        """
+        if self._daily_amounts is None:
+            self._daily_amounts = self.df.groupby(
+                ['week_category', 'completion_date', 'MRP管理者'], observed=True
+            )['amount'].sum()
+        return self._daily_amounts
+
     def generate_all_reports(self):
         """
         すべてのレポートを生成してファイルに出力する。
         """
         logger.info("全レポートの生成を開始します。")
-        self.generate_details_report()
-        self.generate_daily_summary()
-        self.generate_weekly_summary()
+        # 3つのレポートはself.dfを読むだけで出力先も別のため、スレッドで並列に生成する
+        generators = [self.generate_details_report, self.generate_daily_summary, self.generate_weekly_summary]
+        # 日別・週別サマリーが共用する集計は、スレッドで重複して計算しないよう先に求めておく
+        self._get_daily_amounts()
+        with ThreadPoolExecutor(max_workers=len(generators)) as executor:
+            list(executor.map(lambda generate: generate(), generators))
         logger.info(f"全レポートが {self.reports_dir} に出力されました。")
 
     def generate_details_report(self):
@@ -86,8 +159,14 @@ class ReportGenerator:
             # 金額を整数に変換 (仕様に合わせて)
             report_df['金額'] = report_df['金額'].fillna(0).astype(int)
 
+            # 数量は読み込み時にfloatで保持しているため、すべて整数値なら整数として出力する
+            for col in ['計画数', '完成数']:
+                values = pd.to_numeric(report_df[col], errors='coerce')
+                if (values.dropna() % 1 == 0).all():
+                    report_df[col] = values.astype('Int64')
+
             output_path = self.reports_dir / "明細_抜粋.txt"
-            report_df.to_csv(output_path, sep='\t', index=False, encoding='utf-8-sig')
+            _write_report(report_df, output_path)
             logger.info(f"明細_抜粋レポートが {output_path} に保存されました。")
 
         except Exception as e:
@@ -99,22 +178,15 @@ class ReportGenerator:
         """
         logger.info("レポート2: 日別サマリー を生成しています...")
         try:
-            # 日別、MRP管理者別に金額を集計
-            daily_summary = self.df.groupby(['week_category', 'completion_date', 'MRP管理者'])['amount'].sum().reset_index()
-
-            # MRP管理者を列にピボット
-            pivot_df = daily_summary.pivot_table(
-                index=['week_category', 'completion_date'],
-                columns='MRP管理者',
-                values='amount',
-                fill_value=0
-            ).reset_index()
-
-            # 必要なPCの列をすべて存在させる
+            # 日別、MRP管理者別の金額集計をMRP管理者をそのまま列に展開する
+            # 必要なPCの列はreindexでまとめて存在させる
             all_pcs = [f'PC{i}' for i in range(1, 7)]
-            for pc in all_pcs:
-                if pc not in pivot_df.columns:
-                    pivot_df[pc] = 0
+            pivot_df = (
+                self._get_daily_amounts()
+                .unstack('MRP管理者', fill_value=0)
+                .reindex(columns=all_pcs, fill_value=0)
+                .reset_index()
+            )
 
             # 日別金額（合計）を計算
             pivot_df['日別金額'] = pivot_df[all_pcs].sum(axis=1)
@@ -131,12 +203,11 @@ class ReportGenerator:
                 'completion_date': '完成日'
             })[final_columns]
 
-            # 金額を整数に変換
-            for col in ['PC1', 'PC2', 'PC4', 'PC5', 'PC6', '日別金額']:
-                report_df[col] = report_df[col].astype(int)
+            # 金額を整数に変換（列ごとの代入ではなく1回のastypeでまとめて変換する）
+            report_df = report_df.astype({col: int for col in ['PC1', 'PC2', 'PC4', 'PC5', 'PC6', '日別金額']})
 
             output_path = self.reports_dir / "日別サマリー.txt"
-            report_df.to_csv(output_path, sep='\t', index=False, encoding='utf-8-sig')
+            _write_report(report_df, output_path)
             logger.info(f"日別サマリーレポートが {output_path} に保存されました。")
 
         except Exception as e:
@@ -148,22 +219,14 @@ class ReportGenerator:
         """
         logger.info("レポート3: 週別サマリー を生成しています...")
         try:
-            # 週別、MRP管理者別に金額を集計
-            weekly_summary = self.df.groupby(['week_category', 'MRP管理者'])['amount'].sum().reset_index()
-
-            # MRP管理者を列にピボット
-            pivot_df = weekly_summary.pivot_table(
-                index='week_category',
-                columns='MRP管理者',
-                values='amount',
-                fill_value=0
-            )
-
-            # 必要なPCの列をすべて存在させる
+            # 日別の集計を週別、MRP管理者別に足し上げ（self.dfは再走査しない）、MRP管理者をそのまま列に展開する
+            # 必要なPCの列はreindexでまとめて存在させる
             all_pcs = [f'PC{i}' for i in range(1, 7)]
-            for pc in all_pcs:
-                if pc not in pivot_df.columns:
-                    pivot_df[pc] = 0
+            pivot_df = (
+                self._get_daily_amounts().groupby(level=['week_category', 'MRP管理者'], observed=True).sum()
+                .unstack('MRP管理者', fill_value=0)
+                .reindex(columns=all_pcs, fill_value=0)
+            )
 
             # 合計列を計算
             pivot_df['合計'] = pivot_df[all_pcs].sum(axis=1)
@@ -177,12 +240,11 @@ class ReportGenerator:
             final_columns = ['PC1', 'PC2', 'PC4', 'PC5', 'PC6', '合計']
             report_df = pivot_df.rename_axis('週区分').reset_index()[['週区分'] + final_columns]
 
-            # 金額を整数に変換
-            for col in final_columns:
-                report_df[col] = report_df[col].astype(int)
+            # 金額を整数に変換（列ごとの代入ではなく1回のastypeでまとめて変換する）
+            report_df = report_df.astype({col: int for col in final_columns})
 
             output_path = self.reports_dir / "週別サマリー.txt"
-            report_df.to_csv(output_path, sep='\t', index=False, encoding='utf-8-sig')
+            _write_report(report_df, output_path)
             logger.info(f"週別サマリーレポートが {output_path} に保存されました。")
 
         except Exception as e:
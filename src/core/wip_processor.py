@@ -1,10 +1,61 @@
+import numpy as np
 import pandas as pd
 import sqlite3
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
+
+from src.models.database import get_db_connection
 
 logger = logging.getLogger(__name__)
 
+# タブ区切りファイルの読み込みエンジン。pyarrowがあれば使用し、なければCパーサーを使う。
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.compute as pc
+    TSV_READ_OPTIONS = {'sep': '\t', 'engine': 'pyarrow'}
+except ImportError:
+    pa = pacsv = pc = None
+    TSV_READ_OPTIONS = {'sep': '\t', 'engine': 'c', 'low_memory': False}
+
+# xlsxの読み込みエンジン。python-calamine（Rust実装）があれば使用し、なければopenpyxlを使う。
+# pandasのopenpyxlリーダーはread_only=True, data_only=Trueでブックを開くため、フォールバックでもストリーミングで読む。
+try:
+    import python_calamine  # noqa: F401
+    XLSX_READ_ENGINE = 'calamine'
+except ImportError:
+    XLSX_READ_ENGINE = 'openpyxl'
+
+# 行を絞り込みながら読み込む場合の1チャンクあたりの行数
+TSV_CHUNK_SIZE = 200_000
+
+# pyarrowのCSVリーダーで欠損として扱う文字列。pandasのread_csvの既定値と同じ
+TSV_NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+# 文字列のまま保存する列。pyarrowとCパーサーのどちらで読んでも同じテーブル定義になるよう、両方で型推論させない
+# （pyarrowは日付らしい値をDATE型に推論するが、CパーサーはTEXTのまま読むため）
+STORAGE_LOCATION_TEXT_COLUMNS = [
+    'ﾌﾟﾗﾝﾄ', '責任部署', '棚卸報告区分', '保管場所名', '工場在庫区分', '営業在庫区分',
+    '工場区分', '工場区分2', '使用不可区分', '所要check'
+]
+ZS65_TEXT_COLUMNS = ['品目コード', '品目テキスト', 'プラント']
+
+def _to_numeric_coerce(values: pd.Series) -> pd.Series:
+    """
+    列を数値に変換する。変換できない値は欠損にする。
+    桁区切りのカンマを含む列は文字列として読み込まれるため、カンマを除いてから変換する
+    （数値として読み込まれた列はそのまま通す。数値と文字列が混在する列も文字列にそろえてから処理する）。
+    """
+    if values.dtype == object:
+        values = values.astype(str).str.replace(',', '', regex=False)
+    return pd.to_numeric(values, errors='coerce')
+
 class WipDataProcessor:
     """
     仕掛関連のデータファイルを処理し、データベースにロードするクラス。
@@ -12,8 +63,83 @@ class WipDataProcessor:
     def __init__(self, conn: sqlite3.Connection, mode: str = 'dev'):
         self.conn = conn
         self.mode = mode
+        # run_allでファイルを並列に処理する際、書き込みを1つずつ行わせるためのロック
+        self._write_lock = threading.Lock()
         logger.info(f"WipDataProcessor initialized in '{self.mode}' mode.")
 
+    def _replace_table(self, table_name: str, df: pd.DataFrame):
+        """
+        DataFrameの列構成でテーブルを作り直し、全行を1トランザクションでexecutemanyする。
+        to_sql(if_exists='replace')と同じテーブル定義・値の変換を行う。
+        """
+        # テーブル定義はto_sqlと同じ型推論で生成する（日時列はTIMESTAMP）
+        create_sql = pd.io.sql.get_schema(df, table_name, con=self.conn)
+        datetime_cols = df.select_dtypes(include=['datetime', 'datetimetz']).columns
+        if len(datetime_cols) > 0:
+            # 呼び出し元のDataFrameは変更しないが、全列の複製は作らず日時列だけを差し替える
+            df = df.copy(deep=False)
+            for col in datetime_cols:
+                df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+        # NaN/NaTはNULLとして挿入し、numpyの数値型はPythonの値に変換する
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+        quoted_cols = ', '.join('"' + str(col).replace('"', '""') + '"' for col in df.columns)
+        placeholders = ', '.join(['?'] * len(df.columns))
+        with self._write_lock, self.conn:
+            # DDLは暗黙のトランザクションを開始しないため、明示的にBEGINして
+            # テーブルの削除から挿入までを1つのトランザクションにまとめる（失敗時は元のテーブルが残る）
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            self.conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            self.conn.execute(create_sql)
+            self.conn.executemany(
+                f'INSERT OR IGNORE INTO "{table_name}" ({quoted_cols}) VALUES ({placeholders})', rows
+            )
+
+    def _read_tsv_header(self, file_path: Path, encoding: str) -> list:
+        """タブ区切りファイルのヘッダー行だけを読み、列名のリストを返す。"""
+        return pd.read_csv(file_path, sep='\t', encoding=encoding, nrows=0).columns.tolist()
+
+    def _read_tsv_filtered(self, file_path: Path, row_filter, **read_kwargs) -> pd.DataFrame:
+        """
+        タブ区切りファイルを読み込み、row_filter（DataFrameを受け取りブールのマスクを返す）で行を絞り込む。
+        Cパーサーではチャンク単位で読み込みながら絞り込み、捨てる行を含むファイル全体のフレームを作らない。
+        pyarrowエンジンはチャンク読み込みに対応していないため、全体を読み込んでから絞り込む。
+        """
+        if TSV_READ_OPTIONS['engine'] == 'pyarrow':
+            df = pd.read_csv(file_path, **read_kwargs, **TSV_READ_OPTIONS)
+            return df[row_filter(df)]
+        chunks = pd.read_csv(file_path, chunksize=TSV_CHUNK_SIZE, **read_kwargs, **TSV_READ_OPTIONS)
+        return pd.concat([chunk[row_filter(chunk)] for chunk in chunks])
+
+    def _read_tsv_arrow(self, file_path: Path, encoding: str, column_mapping: dict,
+                        string_columns=(), row_filter=None) -> pd.DataFrame:
+        """
+        pyarrowのCSVリーダーでタブ区切りファイルを直接読み込み、Arrowテーブルのまま行の絞り込みと列名の変更を行ってから
+        DataFrameに変換する（変換時はArrowのバッファを解放しながら列ごとにブロックを作る）。
+        欠損値の扱いはpandasのpyarrowエンジンと同じにする。
+
+        :param string_columns: 型推論させずに文字列で読む列
+        :param row_filter: Arrowテーブルを受け取りブールの配列を返す関数
+        """
+        table = pacsv.read_csv(
+            file_path,
+            read_options=pacsv.ReadOptions(encoding=encoding),
+            parse_options=pacsv.ParseOptions(delimiter='\t'),
+            convert_options=pacsv.ConvertOptions(
+                null_values=TSV_NA_VALUES, strings_can_be_null=True,
+                column_types={col: pa.string() for col in string_columns}
+            )
+        )
+        if row_filter is not None:
+            table = table.filter(row_filter(table))
+        # pandasと同じく、すべて欠損の列はfloat64として扱う
+        table = table.cast(pa.schema([
+            field.with_type(pa.float64()) if pa.types.is_null(field.type) else field for field in table.schema
+        ]))
+        table = table.rename_columns([column_mapping.get(col, col) for col in table.column_names])
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
     def process_wip_details(self, file_path: Path):
         logger.info(f"仕掛明細ファイルの処理を開始します: {file_path}")
         try:
@@ -23,11 +149,12 @@ class WipDataProcessor:
 
             # 本番はxlsx、テストはcsvのため拡張子で分岐
             if file_path.suffix.lower() == '.xlsx':
-                df = pd.read_excel(file_path, skiprows=3, header=0, engine='openpyxl')
+                df = pd.read_excel(file_path, skiprows=3, header=0, engine=XLSX_READ_ENGINE)
             else: # テスト用のCSVファイル
                 # 開発(サンプル)はヘッダー0行、本番は3行と想定
                 skip = 3 if self.mode == 'prod' else 0
-                df = pd.read_csv(file_path, sep='\\t', engine='python', skiprows=skip, header=0, encoding='utf-8-sig')
+                # pyarrowエンジンはheader指定時にskiprowsを無視するため、ヘッダー行の位置で読み飛ばしを指定する
+                df = pd.read_csv(file_path, header=skip, encoding='utf-8-sig', **TSV_READ_OPTIONS)
 
             column_mapping = {
                 'キー': 'wip_type', 'ﾌﾟﾗﾝﾄ': 'plant', 'MRP管理者': 'mrp_controller',
@@ -44,16 +171,23 @@ class WipDataProcessor:
 
             df['wip_key'] = df['order_number']
 
-            numeric_cols = ['amount_jpy', 'material_cost', 'expense_cost']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+            # 金額列はまとめて数値に変換し、変換できない値と欠損は0にする
+            numeric_cols = [col for col in ['amount_jpy', 'material_cost', 'expense_cost'] if col in df.columns]
+            if numeric_cols:
+                df[numeric_cols] = df[numeric_cols].apply(_to_numeric_coerce).fillna(0)
 
-            subset_cols = ['wip_key', 'order_number', 'item_code']
-            df.drop_duplicates(subset=subset_cols, keep='first', inplace=True)
+            # 重複判定キー（wip_key, order_number, item_code）を1本のint64にまとめて重複を判定する
+            # wip_keyはorder_numberの複製のため、order_numberとitem_codeの因子化コードを組み合わせれば衝突しない
+            order_codes, _ = pd.factorize(df['order_number'])
+            item_codes, item_uniques = pd.factorize(df['item_code'])
+            # 欠損値のコード-1も1つの値として扱えるよう+1してから組み合わせる
+            key = (order_codes.astype('int64') + 1) * (len(item_uniques) + 1) + (item_codes + 1)
+            _, first_idx = np.unique(key, return_index=True)
+            df = df.iloc[np.sort(first_idx)]
 
-            df.to_sql('wip_details', self.conn, if_exists='replace', index=False)
+            self._replace_table('wip_details', df)
             logger.info(f"{len(df)}件の仕掛明細データをDBにロードしました。")
+            return len(df)
         except Exception as e:
             logger.error(f"仕掛明細ファイルの処理中にエラーが発生しました: {e}", exc_info=True)
 
@@ -62,17 +196,21 @@ class WipDataProcessor:
         try:
             encoding = 'cp932' if self.mode == 'prod' else 'utf-8'
             logger.info(f"Using encoding: {encoding} for ZP58")
-            df = pd.read_csv(file_path, sep='\\t', engine='python', encoding=encoding)
+            df = pd.read_csv(file_path, encoding=encoding, **TSV_READ_OPTIONS)
             df.rename(columns={'指図／ネットワーク': 'order_number'}, inplace=True)
             df.dropna(subset=['order_number'], inplace=True)
             # ゼロパディングされた文字列を数値に変換し、再度文字列に戻すことで正規化する
-            df['order_number'] = pd.to_numeric(df['order_number'], errors='coerce')
-            df.dropna(subset=['order_number'], inplace=True)
-            df['order_number'] = df['order_number'].astype('Int64').astype(str)
+            # 同じ指図番号が繰り返し現れるため、ユニークな値だけを正規化してから各行に割り当てる
+            codes, uniques = pd.factorize(df['order_number'])
+            normalized = pd.to_numeric(pd.Series(uniques), errors='coerce')
+            valid = normalized.notna().to_numpy()[codes]
+            df = df[valid].copy()
+            df['order_number'] = normalized.astype('Int64').astype(str).to_numpy()[codes[valid]]
 
             df.drop_duplicates(inplace=True)
-            df.to_sql('zp58_records', self.conn, if_exists='replace', index=False)
+            self._replace_table('zp58_records', df)
             logger.info(f"{len(df)}件のZP58データをDBにロードしました。")
+            return len(df)
         except Exception as e:
             logger.error(f"ZP58ファイルの処理中にエラーが発生しました: {e}", exc_info=True)
 
@@ -81,45 +219,63 @@ class WipDataProcessor:
         try:
             encoding = 'cp932' if self.mode == 'prod' else 'utf-8'
             logger.info(f"Using encoding: {encoding} for ZP02")
-            df = pd.read_csv(file_path, sep='\\t', engine='python', encoding=encoding)
-
-            # フィルタリング: MRP管理者が'PC'で始まるもののみ
-            if 'MRP管理者' in df.columns:
-                df = df[df['MRP管理者'].str.startswith('PC', na=False)]
-
             column_mapping = {
                 '指図番号': 'order_number', '指図ステータス': 'order_status', 'MRP管理者': 'mrp_controller',
                 'MRP管理者名': 'mrp_controller_name', '品目コード': 'item_code', '品目テキスト': 'item_text',
                 '台数': 'quantity', 'ＷＢＳ要素': 'wbs_element', 'DLV日付': 'completion_date', 'TECO日付': 'teco_date'
             }
-            # 存在する列のみを選択してリネーム
-            cols_to_use = [col for col in column_mapping.keys() if col in df.columns]
-            df = df[cols_to_use].rename(columns=column_mapping)
+            # 存在する列のみを読み込み、リネームする（使わない列はパーサーで読み飛ばす）
+            header_cols = self._read_tsv_header(file_path, encoding)
+            cols_to_use = [col for col in column_mapping.keys() if col in header_cols]
+            # MRP管理者はフィルタで文字列として扱うため、型推論させずに文字列で読む
+            dtype = {'MRP管理者': str} if 'MRP管理者' in header_cols else None
+            # フィルタリング: MRP管理者が'PC'で始まるもののみ（読み込みと同時に絞り込む）
+            if 'MRP管理者' in header_cols:
+                df = self._read_tsv_filtered(
+                    file_path, lambda chunk: chunk['MRP管理者'].str.startswith('PC', na=False),
+                    encoding=encoding, usecols=cols_to_use, dtype=dtype
+                )
+            else:
+                df = pd.read_csv(file_path, encoding=encoding, usecols=cols_to_use, **TSV_READ_OPTIONS)
+
+            # 列の並び替えで作られたフレームをそのまま使い、リネームで再度複製しない
+            df = df[cols_to_use]
+            df.rename(columns=column_mapping, inplace=True)
 
             if 'completion_date' in df.columns:
                 df['completion_date'] = pd.to_datetime(df['completion_date'], errors='coerce')
             if 'teco_date' in df.columns:
                 df['teco_date'] = pd.to_datetime(df['teco_date'], errors='coerce')
 
-            df.to_sql('zp02_records', self.conn, if_exists='replace', index=False)
+            self._replace_table('zp02_records', df)
             logger.info(f"{len(df)}件のZP02データをDBにロードしました。")
+            return len(df)
         except Exception as e:
             logger.error(f"ZP02ファイルの処理中にエラーが発生しました: {e}", exc_info=True)
 
     def process_storage_locations(self, file_path: Path):
         logger.info(f"保管場所一覧ファイルの処理を開始します: {file_path}")
         try:
-            # This file seems to be consistently utf-8-sig
-            df = pd.read_csv(file_path, sep='\\t', engine='python', encoding='utf-8-sig')
             column_mapping = {
                 'ﾌﾟﾗﾝﾄ': 'plant', '責任部署': 'responsible_dept', '棚卸報告区分': 'inventory_report_category',
                 '保管場所': 'storage_location', '保管場所名': 'storage_location_name', '工場在庫区分': 'factory_stock_category',
                 '営業在庫区分': 'sales_stock_category', '工場区分': 'factory_category', '工場区分2': 'factory_category_2',
                 '使用不可区分': 'unusable_category', '棚番チェック用': 'shelf_check_flag', '所要check': 'requirements_check'
             }
-            df.rename(columns=column_mapping, inplace=True)
-            df.to_sql('storage_locations', self.conn, if_exists='replace', index=False)
+            # This file seems to be consistently utf-8-sig
+            if pa is not None:
+                df = self._read_tsv_arrow(
+                    file_path, 'utf-8-sig', column_mapping, string_columns=STORAGE_LOCATION_TEXT_COLUMNS
+                )
+            else:
+                df = pd.read_csv(
+                    file_path, encoding='utf-8-sig', dtype={col: str for col in STORAGE_LOCATION_TEXT_COLUMNS},
+                    **TSV_READ_OPTIONS
+                )
+                df.rename(columns=column_mapping, inplace=True)
+            self._replace_table('storage_locations', df)
             logger.info(f"{len(df)}件の保管場所マスターデータをDBにロードしました。")
+            return len(df)
         except Exception as e:
             logger.error(f"保管場所一覧ファイルの処理中にエラーが発生しました: {e}", exc_info=True)
 
@@ -128,41 +284,110 @@ class WipDataProcessor:
         try:
             encoding = 'cp932' if self.mode == 'prod' else 'utf-8'
             logger.info(f"Using encoding: {encoding} for ZS65")
-            df = pd.read_csv(file_path, sep='\\t', engine='python', encoding=encoding)
-
-            # フィルタリング: プラントが'P100'のもののみ
-            if 'プラント' in df.columns:
-                df = df[df['プラント'] == 'P100']
-
             column_mapping = {
                 '品目コード': 'item_code', 'プラント': 'plant', '品目テキスト': 'item_text', '保管場所': 'storage_location',
                 '利用可能評価在庫': 'available_stock', '利用可能値': 'available_value', '滞留日数': 'stagnant_days'
             }
-            # 存在する列のみリネーム
-            df.rename(columns={k: v for k, v in column_mapping.items() if k in df.columns}, inplace=True)
-            df.to_sql('zs65_records', self.conn, if_exists='replace', index=False)
+            # フィルタリング: プラントが'P100'のもののみ（読み込みと同時に絞り込む）
+            # プラントは文字列で比較するため、他の文字列の列と同じく型推論させずに文字列で読む
+            text_dtypes = {col: str for col in ZS65_TEXT_COLUMNS}
+            has_plant = 'プラント' in self._read_tsv_header(file_path, encoding)
+            if pa is not None:
+                # pyarrowではDataFrameに変換する前にArrowテーブルのまま絞り込む
+                df = self._read_tsv_arrow(
+                    file_path, encoding, column_mapping, string_columns=ZS65_TEXT_COLUMNS,
+                    row_filter=(lambda table: pc.equal(table['プラント'], 'P100')) if has_plant else None
+                )
+            else:
+                if has_plant:
+                    df = self._read_tsv_filtered(
+                        file_path, lambda chunk: chunk['プラント'].to_numpy() == 'P100',
+                        encoding=encoding, dtype=text_dtypes
+                    )
+                else:
+                    df = pd.read_csv(file_path, encoding=encoding, dtype=text_dtypes, **TSV_READ_OPTIONS)
+                # 存在する列のみリネーム
+                df.rename(columns={k: v for k, v in column_mapping.items() if k in df.columns}, inplace=True)
+            self._replace_table('zs65_records', df)
             logger.info(f"{len(df)}件のZS65データをDBにロードしました。")
+            return len(df)
         except Exception as e:
             logger.error(f"ZS65ファイルの処理中にエラーが発生しました: {e}", exc_info=True)
 
-    def clear_all_wip_stock_tables(self):
-        logger.info("仕掛・在庫関連テーブルのデータをクリアします。")
-        cursor = self.conn.cursor()
+    def _source_mtime_ns(self, file_path: Path) -> Optional[int]:
         try:
-            tables = ['wip_details', 'zp02_records', 'zp58_records', 'storage_locations', 'zs65_records']
-            for table in tables:
-                cursor.execute(f"DELETE FROM {table};")
-            self.conn.commit()
-            logger.info("仕掛・在庫関連テーブルのクリアが完了しました。")
-        except Exception as e:
-            logger.error(f"テーブルクリア中にエラーが発生しました: {e}", exc_info=True)
-            self.conn.rollback()
+            return file_path.stat().st_mtime_ns if file_path else None
+        except OSError:
+            return None
+
+    def _is_already_loaded(self, table: str, file_path: Path, mtime_ns: int) -> bool:
+        """前回ロードした元ファイルと、パス・更新日時が同じかどうか。"""
+        row = self.conn.execute(
+            "SELECT source_path, mtime_ns FROM etl_meta WHERE table_name = ?;", (table,)
+        ).fetchone()
+        return row is not None and row[0] == str(file_path) and row[1] == mtime_ns
+
+    def _record_load(self, table: str, file_path: Path, mtime_ns: Optional[int], row_count: Optional[int]):
+        with self._write_lock, self.conn:
+            if mtime_ns is None or row_count is None:
+                # 処理に失敗した場合は記録を消し、次回は必ず読み込み直す
+                self.conn.execute("DELETE FROM etl_meta WHERE table_name = ?;", (table,))
+            else:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO etl_meta (table_name, source_path, mtime_ns, row_count) VALUES (?, ?, ?, ?);",
+                    (table, str(file_path), mtime_ns, row_count)
+                )
+
+    def _database_file(self) -> str:
+        """接続先のデータベースファイルのパスを返す。インメモリDBの場合は空文字列。"""
+        return self.conn.execute("PRAGMA database_list;").fetchone()[2]
+
+    def _run_step(self, process_name: str, file_path: Path, table: str, mtime_ns: Optional[int], db_file: str = ''):
+        """
+        1ファイル分の処理（ロード、ロード記録）を行う。
+        テーブルは事前に空にせず、ロードに失敗した場合は前回ロードしたデータをそのまま残す。
+        db_fileが指定された場合は、スレッドごとに専用の接続を開いて処理する（sqlite3の接続はスレッド間で共有できないため）。
+        """
+        if not db_file:
+            worker, conn = self, None
+        else:
+            conn = get_db_connection(Path(db_file))
+            worker = WipDataProcessor(conn, mode=self.mode)
+            worker._write_lock = self._write_lock
+        try:
+            row_count = getattr(worker, process_name)(file_path)
+            worker._record_load(table, file_path, mtime_ns, row_count)
+        finally:
+            if conn is not None:
+                conn.close()
 
     def run_all(self, wip_details_path: Path, zp58_path: Path, zp02_path: Path, storage_locations_path: Path, zs65_path: Path):
-        self.clear_all_wip_stock_tables()
-        self.process_wip_details(wip_details_path)
-        self.process_zp58(zp58_path)
-        self.process_zp02(zp02_path)
-        self.process_storage_locations(storage_locations_path)
-        self.process_zs65(zs65_path)
+        steps = [
+            ('process_wip_details', wip_details_path, 'wip_details'),
+            ('process_zp58', zp58_path, 'zp58_records'),
+            ('process_zp02', zp02_path, 'zp02_records'),
+            ('process_storage_locations', storage_locations_path, 'storage_locations'),
+            ('process_zs65', zs65_path, 'zs65_records'),
+        ]
+        pending = []
+        for process_name, file_path, table in steps:
+            # 元ファイルが前回のロード時から変わっていなければ、テーブルはそのまま使う
+            mtime_ns = self._source_mtime_ns(file_path)
+            if mtime_ns is not None and self._is_already_loaded(table, file_path, mtime_ns):
+                logger.info(f"{table} の元ファイルは前回のロードから更新されていないため、スキップします: {file_path}")
+                continue
+            pending.append((process_name, file_path, table, mtime_ns))
+
+        db_file = self._database_file()
+        if db_file and len(pending) > 1:
+            # 各ファイルは別々のテーブルに読み込むため、ファイルの読み込みと変換はスレッドで並列に行う
+            # （DBへの書き込みはロックで1つずつ行う）
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = [executor.submit(self._run_step, *step, db_file=db_file) for step in pending]
+                for future in futures:
+                    future.result()
+        else:
+            # インメモリDBは他の接続から見えないため、同じ接続で順番に処理する
+            for step in pending:
+                self._run_step(*step)
         logger.info("すべての仕掛・在庫関連ファイルの処理が完了しました。")
@@ -8,12 +8,12 @@ import sqlite3
 import re
 import datetime
 
-from src.models.database import get_db_connection
+from src.models.database import get_db_connection, is_data_file_processed, record_data_file_processed
 from src.models.migration_manager import apply_migrations
 from src.core.data_processor import DataProcessor
 from src.core.wip_processor import WipDataProcessor
 from src.core.analytics import ProductionAnalytics, ErrorDetection
-from src.core.reporter import ReportGenerator
+from src.core.reporter import ReportGenerator, write_quantity_inconsistency_report
 from src.config import settings
 from src.utils.logging_config import setup_logging
 
@@ -34,14 +34,19 @@ def find_latest_wip_file(directory: Path) -> Path:
             logger.warning(f"仕掛明細のディレクトリが見つかりません: {directory}")
             return None
 
-        for f in directory.iterdir():
-            if f.is_file():
-                match = pattern.match(f.name)
-                if match:
+        # 共有フォルダには無関係なファイルが多いため、scandirのエントリ情報でファイルかどうかを判定し、
+        # 名前に固定部分を含まないものは正規表現にかけずに読み飛ばす
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if '仕掛明細表_WBS集約' not in name or '.xlsx' not in name:
+                    continue
+                match = pattern.match(name)
+                if match and entry.is_file():
                     timestamp_str = match.group(1)
                     if not latest_timestamp or timestamp_str > latest_timestamp:
                         latest_timestamp = timestamp_str
-                        latest_file = f
+                        latest_file = Path(entry.path)
     except Exception as e:
         logger.error(f"ディレクトリ検索中にエラーが発生しました: {directory}, エラー: {e}", exc_info=True)
         return None
@@ -53,8 +58,11 @@ def find_latest_wip_file(directory: Path) -> Path:
 
     return latest_file
 
-def run_pipeline(conn: sqlite3.Connection, data_path: Path):
-    """一回のデータ処理パイプラインを実行する（エラーハンドリング強化版）"""
+def run_pipeline(conn: sqlite3.Connection, data_path: Path, strict: bool = False, force: bool = False):
+    """
+    一回のデータ処理パイプラインを実行する（エラーハンドリング強化版）。正常に完了した場合はTrueを返す。
+    データファイルが前回正常に処理した時から更新されていなければ、forceでない限り処理をスキップする。
+    """
     logger.info("パイプライン処理を開始します。")
 
     # ファイル存在チェック（最大3回リトライ）
@@ -73,7 +81,7 @@ def run_pipeline(conn: sqlite3.Connection, data_path: Path):
                     continue
                 else:
                     logger.error(f"データファイルにアクセスできませんでした: {data_path}")
-                    return
+                    return False
         except Exception as e:
             logger.warning(f"ファイルアクセス中にエラーが発生しました: {e} (試行 {attempt + 1}/{max_retries})")
             if attempt < max_retries - 1:
@@ -81,11 +89,20 @@ def run_pipeline(conn: sqlite3.Connection, data_path: Path):
                 continue
             else:
                 logger.error(f"ファイルアクセスに失敗しました: {data_path}")
-                return
+                return False
 
     try:
-        processor = DataProcessor(conn)
+        # 同じデータの再処理（読み込み・挿入・集計・レポート出力）は行わない
+        mtime_ns = data_path.stat().st_mtime_ns
+        if not force and is_data_file_processed(conn, data_path, mtime_ns):
+            logger.info(f"データファイルは前回の処理から更新されていないため、処理をスキップします: {data_path}")
+            return True
+
+        processor = DataProcessor(conn, strict=strict)
         summary = processor.process_file_and_load_to_db(data_path)
+        if summary.get('status') == 'failed':
+            logger.error(f"データファイルの処理に失敗しました: {summary.get('error')}")
+            return False
 
         logger.info("========== 処理結果サマリー ==========")
         logger.info(f"  ファイル: {summary.get('file')}")
@@ -107,8 +124,9 @@ def run_pipeline(conn: sqlite3.Connection, data_path: Path):
             logger.info("========== データ整合性チェック ==========")
             error_detector = ErrorDetection(conn)
             inconsistencies = error_detector.find_quantity_inconsistencies()
-            if not inconsistencies.empty:
-                logger.warning(f"{len(inconsistencies)}件の数量の不整合を検出しました。")
+            report_path = write_quantity_inconsistency_report(inconsistencies)
+            if report_path is not None:
+                logger.warning(f"{len(inconsistencies)}件の数量の不整合を検出しました。明細: {report_path}")
             else:
                 logger.info("数量の不整合は見つかりませんでした。")
 
@@ -116,14 +134,16 @@ def run_pipeline(conn: sqlite3.Connection, data_path: Path):
             reporter = ReportGenerator(processor.final_df)
             reporter.generate_all_reports()
 
+        record_data_file_processed(conn, data_path, mtime_ns, summary.get('successful_inserts', 0))
         logger.info("パイプライン処理が正常に完了しました。")
+        return True
 
     except Exception as e:
         logger.error(f"パイプライン処理中にエラーが発生しました: {e}", exc_info=True)
+        return False
 
 
 def main():
-    setup_logging()
     parser = argparse.ArgumentParser(description="PC製造ダッシュボードのデータ処理サービス")
     parser.add_argument('--sync-master', action='store_true', help='品目マスターCSVをデータベースに同期して終了します。')
     parser.add_argument('--sync-wip', action='store_true', help='仕掛関連ファイルをデータベースに同期して終了します。')
@@ -131,7 +151,11 @@ def main():
     parser.add_argument('--prod', action='store_true', help='本番モードで実行し、ネットワークパス上のファイルを参照します。')
     parser.add_argument('--single-run', action='store_true', help='1回だけデータ処理を実行して終了します（スケジューラー用）')
     parser.add_argument('--health-check', action='store_true', help='システムの健全性をチェックして終了します')
+    parser.add_argument('--strict', action='store_true', help='DBへ挿入する行をPydanticモデルで検証します（低速）')
+    parser.add_argument('--force', action='store_true', help='データファイルが前回の処理から更新されていなくても処理します')
     args = parser.parse_args()
+    # ローテーションするログファイルは常駐サービスだけが使い、スケジューラーからの単発実行などは別のファイルに出力する
+    setup_logging(rotate=not (args.single_run or args.sync_master or args.sync_wip or args.health_check))
 
     if args.health_check:
         from src.utils.health_check import HealthChecker
@@ -196,12 +220,15 @@ def main():
             sys.exit(0)
 
         if args.single_run:
-            run_pipeline(conn, data_path)
+            run_pipeline(conn, data_path, strict=args.strict, force=args.force)
             logger.info("単発実行完了。プログラムを終了します。")
         else:
             logger.info("常駐サービスモードで起動します。1時間ごとにデータ処理を実行します。")
+            force = args.force
             while True:
-                run_pipeline(conn, data_path)
+                # 更新されていないデータファイルはrun_pipeline内でスキップする（--forceは起動直後の1回目のみ）
+                run_pipeline(conn, data_path, strict=args.strict, force=force)
+                force = False
                 logger.info("次の実行まで1時間待機します...")
                 time.sleep(3600)
 
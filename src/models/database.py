@@ -1,6 +1,9 @@
 import sqlite3
 from pathlib import Path
-from typing import List
+from itertools import chain, islice
+from typing import Iterable, List
+
+import pandas as pd
 
 from src.models.production import ProductionRecord
 from src.config import settings
@@ -12,8 +15,15 @@ def get_db_connection(db_path: Path = settings.DB_PATH) -> sqlite3.Connection:
     """
     # The directory creation is now handled in settings.py
     # detect_typesを無効化し、型変換をPandasに完全に委ねる
-    conn = sqlite3.connect(db_path)
+    # 同じ接続でチャンクごとに繰り返すINSERTや分析クエリの準備済みステートメントを再利用できるよう、キャッシュを大きくする
+    conn = sqlite3.connect(db_path, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    # 一括ロード時の書き込みを高速化する設定（WALでは読み取り中のダッシュボードもブロックしない）
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-200000")
+    conn.execute("PRAGMA mmap_size=268435456")
     return conn
 
 def initialize_schema_version(conn: sqlite3.Connection):
@@ -21,17 +31,19 @@ def initialize_schema_version(conn: sqlite3.Connection):
     `schema_version`テーブルを作成し、バージョン0で初期化する。
     テーブルが既に存在する場合は何もしない。
     """
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS schema_version (
-            version INTEGER NOT NULL PRIMARY KEY
-        );
-    """)
-    # テーブルが空の場合のみバージョン0を挿入
-    cursor.execute("SELECT COUNT(*) FROM schema_version")
-    if cursor.fetchone()[0] == 0:
-        cursor.execute("INSERT INTO schema_version (version) VALUES (0)")
-        conn.commit()
+    # executescriptは実行前に呼び出し元のトランザクションをコミットしてしまうため、executeで1文ずつ実行する
+    # （失敗した場合はwith文でロールバックされる）
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER NOT NULL PRIMARY KEY
+            );
+        """)
+        # テーブルが空の場合のみバージョン0を挿入
+        conn.execute("""
+            INSERT INTO schema_version (version)
+                SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM schema_version);
+        """)
 
 def get_schema_version(conn: sqlite3.Connection) -> int:
     """現在のスキーマバージョンを取得する。"""
@@ -44,6 +56,36 @@ def get_schema_version(conn: sqlite3.Connection) -> int:
         # テーブルが存在しない場合はバージョン0とみなす
         return 0
 
+# 生産実績ファイルの処理記録をetl_metaに保存する際のキー。etl_metaには仕掛・在庫関連テーブルの記録も入るため、
+# それらのテーブル名と重ならない生産実績テーブルの名前を使う（migrations/006 を参照）
+PRODUCTION_META_KEY = 'production_records'
+
+def is_data_file_processed(conn: sqlite3.Connection, data_path: Path, mtime_ns: int) -> bool:
+    """前回正常に処理した生産実績ファイルと、パス・更新日時が同じかどうか。"""
+    row = conn.execute(
+        "SELECT source_path, mtime_ns FROM etl_meta WHERE table_name = ?;", (PRODUCTION_META_KEY,)
+    ).fetchone()
+    return row is not None and row[0] == str(data_path) and row[1] == mtime_ns
+
+def record_data_file_processed(conn: sqlite3.Connection, data_path: Path, mtime_ns: int, row_count: int):
+    """正常に処理した生産実績ファイルのパス・更新日時を記録する（再起動後も同じファイルの再処理を省く）。"""
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO etl_meta (table_name, source_path, mtime_ns, row_count) VALUES (?, ?, ?, ?);",
+            (PRODUCTION_META_KEY, str(data_path), mtime_ns, row_count)
+        )
+
+def invalidate_data_file_processed(conn: sqlite3.Connection):
+    """
+    生産実績ファイルの処理記録を削除し、次回は同じファイルでも処理させる。
+    金額は品目マスターの標準原価から計算するため、マスターを更新したときに呼び出す。
+    コミットは呼び出し元で行う。
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='etl_meta';")
+    if cursor.fetchone() is not None:
+        cursor.execute("DELETE FROM etl_meta WHERE table_name = ?;", (PRODUCTION_META_KEY,))
+
 def create_tables(conn: sqlite3.Connection):
     """
     データベース内に必要なテーブルとインデックスを作成する。
@@ -77,36 +119,101 @@ def create_tables(conn: sqlite3.Connection):
     sql_create_index_input_datetime = "CREATE INDEX IF NOT EXISTS idx_input_datetime ON production_records (input_datetime);"
     sql_create_index_item_code = "CREATE INDEX IF NOT EXISTS idx_item_code ON production_records (item_code);"
 
-    cursor = conn.cursor()
-    cursor.execute(sql_create_table)
-    cursor.execute(sql_create_index_order_number)
-    cursor.execute(sql_create_index_input_datetime)
-    cursor.execute(sql_create_index_item_code)
-    conn.commit()
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute(sql_create_table)
+        cursor.execute(sql_create_index_order_number)
+        cursor.execute(sql_create_index_input_datetime)
+        cursor.execute(sql_create_index_item_code)
+
+# production_recordsへの挿入列。挿入タプルはこの順序で組み立てる。
+PRODUCTION_RECORD_COLUMNS = (
+    'plant', 'storage_location', 'item_code', 'item_text', 'order_number', 'order_type',
+    'mrp_controller', 'order_quantity', 'actual_quantity', 'cumulative_quantity',
+    'remaining_quantity', 'input_datetime', 'planned_completion_date', 'wbs_element',
+    'sales_order_number', 'sales_order_item_number', 'amount'
+)
+
+# production_recordsのUNIQUE制約の列（migrations/003）。同じキーの行はINSERT OR IGNOREで最初の1行だけが残る。
+PRODUCTION_RECORD_UNIQUE_KEY = ('order_number', 'input_datetime')
+
+# 1文で複数行を挿入する場合の行数。古いSQLiteのバインド変数の上限（999）に収まるようにする
+_ROWS_PER_MULTIROW_INSERT = 999 // len(PRODUCTION_RECORD_COLUMNS)
+_ROW_PLACEHOLDERS = f"({', '.join('?' * len(PRODUCTION_RECORD_COLUMNS))})"
 
-def insert_production_records(conn: sqlite3.Connection, records: List[ProductionRecord]):
+def _multirow_insert_sql(row_count: int) -> str:
+    return (
+        f"INSERT OR IGNORE INTO production_records ({', '.join(PRODUCTION_RECORD_COLUMNS)}) VALUES "
+        + ', '.join([_ROW_PLACEHOLDERS] * row_count)
+    )
+
+_FULL_MULTIROW_INSERT_SQL = _multirow_insert_sql(_ROWS_PER_MULTIROW_INSERT)
+
+def _insert_production_rows(cursor: sqlite3.Cursor, rows: Iterable[tuple]):
+    """
+    行タプルを _ROWS_PER_MULTIROW_INSERT 行ずつ1つの INSERT ... VALUES (...), (...) 文にまとめて実行する。
+    executemanyで1行ごとに文を実行するより、実行する文の数が大幅に減る。
+    """
+    rows = iter(rows)
+    while True:
+        params = list(chain.from_iterable(islice(rows, _ROWS_PER_MULTIROW_INSERT)))
+        if not params:
+            return
+        row_count = len(params) // len(PRODUCTION_RECORD_COLUMNS)
+        if row_count == _ROWS_PER_MULTIROW_INSERT:
+            cursor.execute(_FULL_MULTIROW_INSERT_SQL, params)
+        else:
+            cursor.execute(_multirow_insert_sql(row_count), params)
+
+def insert_production_records(conn: sqlite3.Connection, records: List[ProductionRecord], *, commit: bool = True):
     """
     複数の生産実績レコードをデータベースに一括で挿入する。
+    全行は1つのトランザクションで挿入される。
+    レコードごとに属性を取り出すため、ファイル単位の大量の行にはinsert_production_records_from_dfを使う。
+
+    :param commit: Falseの場合はコミットせず、複数回の呼び出しを呼び出し元の1つのトランザクションにまとめられるようにする
     """
-    sql = """
-    INSERT OR IGNORE INTO production_records (
-        plant, storage_location, item_code, item_text, order_number, order_type,
-        mrp_controller, order_quantity, actual_quantity, cumulative_quantity,
-        remaining_quantity, input_datetime, planned_completion_date, wbs_element,
-        sales_order_number, sales_order_item_number, amount
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+    # Pydanticモデルを1行ずつタプルに変換しながら渡し、全行分のリストは作らない。
+    # 同じ一意キーの2件目以降はSQLiteで無視されるだけなので、ここで除いて渡さない
+    def rows_to_insert():
+        seen_keys = set()
+        for r in records:
+            key = (r.order_number, r.input_datetime)
+            if key in seen_keys:
+                continue
+            seen_keys.add(key)
+            yield (
+                r.plant, r.storage_location, r.item_code, r.item_text, r.order_number, r.order_type,
+                r.mrp_controller, r.order_quantity, r.actual_quantity, r.cumulative_quantity,
+                r.remaining_quantity, r.input_datetime, r.planned_completion_date, r.wbs_element,
+                r.sales_order_number, r.sales_order_item_number, r.amount
+            )
+
+    cursor = conn.cursor()
+    _insert_production_rows(cursor, rows_to_insert())
+    if commit:
+        conn.commit()
+
+def insert_production_records_from_df(conn: sqlite3.Connection, df: pd.DataFrame, *, commit: bool = True) -> int:
     """
+    挿入列（PRODUCTION_RECORD_COLUMNS）を持つ検証済みのDataFrameを、Pydanticモデルを経由せずに一括で挿入する。
+    列の並び替えと値の変換は列単位で1回だけ行い、行タプルを複数行のINSERT文にまとめて挿入する。
 
-    # Pydanticモデルをタプルのリストに変換
-    data_to_insert = [
-        (
-            r.plant, r.storage_location, r.item_code, r.item_text, r.order_number, r.order_type,
-            r.mrp_controller, r.order_quantity, r.actual_quantity, r.cumulative_quantity,
-            r.remaining_quantity, r.input_datetime, r.planned_completion_date, r.wbs_element,
-            r.sales_order_number, r.sales_order_item_number, r.amount
-        ) for r in records
-    ]
+    :param commit: Falseの場合はコミットせず、呼び出し元のトランザクションに含める
+    :return: 挿入を試みた行数（DataFrame内で一意キーが重複する行を除いた数）
+    """
+    if df.empty:
+        return 0
+    frame = df.reindex(columns=list(PRODUCTION_RECORD_COLUMNS))
+    # 同じ一意キーの2件目以降はSQLiteで無視されるだけなので、インデックスを引かせる前に列単位で除く
+    duplicated = frame.duplicated(subset=list(PRODUCTION_RECORD_UNIQUE_KEY), keep='first')
+    if duplicated.any():
+        frame = frame[~duplicated.to_numpy()]
+    # sqlite3がバインドできるよう、欠損値はNone、numpyの数値はPythonのint/floatにする
+    rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
 
     cursor = conn.cursor()
-    cursor.executemany(sql, data_to_insert)
-    conn.commit()
+    _insert_production_rows(cursor, rows)
+    if commit:
+        conn.commit()
+    return len(frame)
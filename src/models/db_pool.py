@@ -0,0 +1,45 @@
+"""
+スレッドごとにSQLite接続を1つずつ保持する簡易的な接続プール。
+ダッシュボードの各タブや分析処理のような読み取り側が、表示のたびに接続を開いてPRAGMAを設定し直さないようにする。
+接続はそれを開いたスレッドだけが使うため、check_same_thread の既定の検査はそのまま残す。
+書き込み（パイプライン）は引き続き get_db_connection で開いた専用の接続で行い、
+WALモードにより読み取り側の接続は書き込み中もブロックされない。
+"""
+import sqlite3
+import threading
+from pathlib import Path
+
+from src.config import settings
+from src.models.database import get_db_connection
+
+_local = threading.local()
+
+def get_thread_connection(db_path: Path = settings.DB_PATH) -> sqlite3.Connection:
+    """
+    呼び出し元のスレッド用の接続を返す。同じスレッド・同じDBファイルでは前回開いた接続を再利用する。
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    key = str(db_path)
+    conn = connections.get(key)
+    if conn is None:
+        conn = get_db_connection(db_path)
+        connections[key] = conn
+    return conn
+
+def release_thread_connection(conn: sqlite3.Connection):
+    """
+    接続を閉じずにプールへ戻す。処理が途中で失敗して開いたままのトランザクションがあれば取り消す。
+    """
+    if conn.in_transaction:
+        conn.rollback()
+
+def close_thread_connections():
+    """呼び出し元のスレッドが保持しているすべての接続を閉じる。"""
+    connections = getattr(_local, 'connections', None)
+    if not connections:
+        return
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
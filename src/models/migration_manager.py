@@ -1,6 +1,8 @@
 import sqlite3
 import logging
+import sys
 from pathlib import Path
+import importlib
 import importlib.util
 
 from src.config import settings
@@ -10,10 +12,59 @@ logger = logging.getLogger(__name__)
 
 MIGRATIONS_DIR = settings.ROOT_DIR / "migrations"
 
+# 読み込み済みのマイグレーションファイル一覧とモジュール。同じプロセスで何度もapply_migrationsを呼ぶ場合
+# （テストのsetUpなど）に、ディレクトリの走査とスクリプトの解析・実行を繰り返さないためのキャッシュ。
+# ファイルの追加・更新を反映するため、ディレクトリ・ファイルの更新日時をキーに含める。
+_migration_files_cache = {}
+_migration_module_cache = {}
+
+def _get_migration_files() -> list:
+    """マイグレーションスクリプトをバージョン順に並べたリストを返す。"""
+    key = (MIGRATIONS_DIR, MIGRATIONS_DIR.stat().st_mtime_ns) if MIGRATIONS_DIR.is_dir() else (MIGRATIONS_DIR, None)
+    if key not in _migration_files_cache:
+        _migration_files_cache.clear()
+        _migration_files_cache[key] = sorted(MIGRATIONS_DIR.glob("[0-9][0-9][0-9]_*.py"))
+    return _migration_files_cache[key]
+
+def _load_migration_module(migration_file: Path):
+    """マイグレーションスクリプトをモジュールとして読み込む。変更されていなければ前回読み込んだモジュールを返す。"""
+    key = (migration_file, migration_file.stat().st_mtime_ns)
+    migration_module = _migration_module_cache.get(key)
+    if migration_module is None:
+        migration_module = _import_migration_package_module(migration_file)
+        if migration_module is None:
+            # パッケージとしてインポートできない場合は、ファイルからモジュールを動的にインポート
+            spec = importlib.util.spec_from_file_location(migration_file.stem, migration_file)
+            migration_module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(migration_module)
+        _migration_module_cache[key] = migration_module
+    return migration_module
+
+def _import_migration_package_module(migration_file: Path):
+    """
+    `migrations` パッケージのモジュールとして通常のインポートで読み込む（__pycache__のバイトコードが使われる）。
+    パッケージが見つからない、または別の場所の `migrations` が見つかった場合はNoneを返す。
+    """
+    module_name = f"{MIGRATIONS_DIR.name}.{migration_file.stem}"
+    try:
+        migration_module = sys.modules.get(module_name)
+        if migration_module is None:
+            migration_module = importlib.import_module(module_name)
+        else:
+            # 前回のインポート後にファイルが更新されているため、読み込み直す
+            migration_module = importlib.reload(migration_module)
+    except ImportError:
+        return None
+    if Path(migration_module.__file__).resolve() != migration_file.resolve():
+        return None
+    return migration_module
+
 def _update_schema_version(conn: sqlite3.Connection, version: int):
     """スキーマバージョンを更新する。"""
     cursor = conn.cursor()
     cursor.execute("UPDATE schema_version SET version = ?", (version,))
+    # 再起動時の確認を軽くするため、同じバージョンをデータベースヘッダーのuser_versionにも記録する
+    cursor.execute(f"PRAGMA user_version = {int(version)}")
     conn.commit()
     logger.info(f"データベースのスキーマバージョンを {version} に更新しました。")
 
@@ -22,20 +73,28 @@ def apply_migrations(conn: sqlite3.Connection):
     データベースのマイグレーションを適用する。
     `migrations`ディレクトリ内のスクリプトを検出し、現在のバージョンから順番に実行する。
     """
+    migration_files = _get_migration_files()
+    latest_script_version = int(migration_files[-1].name.split('_')[0]) if migration_files else 0
+
+    # user_versionが最新のスクリプトと一致していれば、schema_versionテーブルの作成・参照も行わずに終了する
+    if migration_files and conn.execute("PRAGMA user_version").fetchone()[0] == latest_script_version:
+        logger.info(f"データベースは最新の状態です（スキーマバージョン: {latest_script_version}）。")
+        return
+
     initialize_schema_version(conn)
     current_version = get_schema_version(conn)
     logger.info(f"現在のデータベーススキーマバージョン: {current_version}")
 
-    migration_files = sorted(MIGRATIONS_DIR.glob("[0-9][0-9][0-9]_*.py"))
-
     if not migration_files:
         logger.info("適用するマイグレーションファイルが見つかりません。")
         return
 
-    latest_script_version = int(migration_files[-1].name.split('_')[0])
     logger.info(f"最新のマイグレーションスクリプトバージョン: {latest_script_version}")
 
     if current_version >= latest_script_version:
+        # user_version導入前に作成されたデータベースは、ここで記録して次回から確認を省略する
+        conn.execute(f"PRAGMA user_version = {int(current_version)}")
+        conn.commit()
         logger.info("データベースは最新の状態です。")
         return
 
@@ -45,10 +104,7 @@ def apply_migrations(conn: sqlite3.Connection):
         if script_version > current_version:
             logger.info(f"マイグレーション {migration_file.name} を適用します...")
             try:
-                # ファイルからモジュールを動的にインポート
-                spec = importlib.util.spec_from_file_location(migration_file.stem, migration_file)
-                migration_module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(migration_module)
+                migration_module = _load_migration_module(migration_file)
 
                 # upgrade関数を実行
                 if hasattr(migration_module, 'upgrade'):
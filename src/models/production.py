@@ -1,7 +1,52 @@
 import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, Field, field_validator, ConfigDict
+import pandas as pd
+from pydantic import BaseModel, Field, field_validator, ConfigDict, TypeAdapter
+
+# 以下のバリデータの変換は、列単位で挿入用のフレームを作る処理（DataProcessor._to_insert_frame）でも
+# 同じ関数をそのまま使うため、モデルの外に置いている
+
+def parse_planned_completion_date(value):
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return None
+    # 呼び出し元で変換済みの日付はそのまま使う（文字列への変換と再解析を行わない）
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return value
+
+    date_str = str(value)
+    if '.' in date_str: # Handle potential float conversion like '20250728.0'
+        date_str = date_str.split('.')[0]
+
+    try:
+        # Handles 'YYYYMMDD' format
+        return datetime.datetime.strptime(date_str, '%Y%m%d').date()
+    except (ValueError, TypeError):
+        # A value was provided but it's not in the correct format.
+        raise ValueError(f"Date format for '{value}' is incorrect, expected YYYYMMDD.")
+
+def empty_str_to_none(value):
+    if isinstance(value, str) and value.strip() == '':
+        return None
+    return value
+
+def clean_sap_number(value):
+    """空文字列をNoneに変換し、先頭のゼロを削除する。"""
+    if not isinstance(value, str):
+        return value
+
+    # Trim whitespace first
+    stripped_val = value.strip()
+
+    if stripped_val == '':
+        return None
+
+    # If it's a numeric string, strip leading zeros
+    if stripped_val.isdigit():
+        return stripped_val.lstrip('0') or '0'
+
+    # Return original stripped value if not purely numeric (e.g., 'I-0310937-20')
+    return stripped_val
 
 class ProductionRecord(BaseModel):
     """
@@ -37,6 +82,9 @@ class ProductionRecord(BaseModel):
     @classmethod
     def to_python_datetime(cls, value):
         """PandasのTimestampをPythonのdatetimeに変換する。"""
+        # 欠損（NaT）はdatetimeのサブクラスで検証を通ってしまうため、Noneとして必須項目のエラーにする
+        if value is pd.NaT:
+            return None
         if hasattr(value, 'to_pydatetime'):
             return value.to_pydatetime()
         return value
@@ -44,43 +92,19 @@ class ProductionRecord(BaseModel):
     @field_validator('planned_completion_date', mode='before')
     @classmethod
     def parse_planned_completion_date(cls, value):
-        if value is None or (isinstance(value, str) and value.strip() == ''):
-            return None
-
-        date_str = str(value)
-        if '.' in date_str: # Handle potential float conversion like '20250728.0'
-            date_str = date_str.split('.')[0]
-
-        try:
-            # Handles 'YYYYMMDD' format
-            return datetime.datetime.strptime(date_str, '%Y%m%d').date()
-        except (ValueError, TypeError):
-            # A value was provided but it's not in the correct format.
-            raise ValueError(f"Date format for '{value}' is incorrect, expected YYYYMMDD.")
+        return parse_planned_completion_date(value)
 
     @field_validator('storage_location', 'wbs_element', mode='before')
     @classmethod
     def empty_str_to_none(cls, value):
-        if isinstance(value, str) and value.strip() == '':
-            return None
-        return value
+        return empty_str_to_none(value)
 
     @field_validator('sales_order_number', 'sales_order_item_number', mode='before')
     @classmethod
     def clean_sap_numbers(cls, value):
         """空文字列をNoneに変換し、先頭のゼロを削除する。"""
-        if not isinstance(value, str):
-            return value
-
-        # Trim whitespace first
-        stripped_val = value.strip()
-
-        if stripped_val == '':
-            return None
-
-        # If it's a numeric string, strip leading zeros
-        if stripped_val.isdigit():
-            return stripped_val.lstrip('0') or '0'
+        return clean_sap_number(value)
 
-        # Return original stripped value if not purely numeric (e.g., 'I-0310937-20')
-        return stripped_val
+# ProductionRecordのリストを一括検証するアダプター。
+# 行ごとにモデルを生成せず、pydantic-coreにリスト全体を1回の呼び出しで検証させる（スキーマの構築はimport時の一度だけ）。
+PRODUCTION_RECORDS_ADAPTER = TypeAdapter(List[ProductionRecord])
@@ -1,13 +1,48 @@
+import atexit
+import datetime
 import logging
+import logging.handlers
+import queue
 import sys
 from src.config import settings
 
-def setup_logging():
+# コンソール・ファイルへの書き込みを行うバックグラウンドのリスナー。setup_logging の再実行時に停止する
+_queue_listener = None
+
+# ログファイルを残す日数
+LOG_BACKUP_DAYS = 14
+
+def _run_log_path(day: datetime.date):
+    """単発実行用のログファイルのパス（例: logs/app_run_20250820.log）。"""
+    log_path = settings.LOG_FILE_PATH
+    return log_path.with_name(f"{log_path.stem}_run_{day:%Y%m%d}{log_path.suffix}")
+
+def _remove_old_run_logs():
+    """単発実行用のログファイルのうち、LOG_BACKUP_DAYS日より古いものを削除する。"""
+    log_path = settings.LOG_FILE_PATH
+    run_logs = sorted(log_path.parent.glob(f"{log_path.stem}_run_*{log_path.suffix}"))
+    for old_log in run_logs[:-LOG_BACKUP_DAYS]:
+        try:
+            old_log.unlink()
+        except OSError:
+            # 他のプロセスが開いている場合は次回の実行で削除する
+            pass
+
+def setup_logging(rotate: bool = True):
     """
     アプリケーションのロギングを設定する。
     - コンソールとログファイルの両方に出力する。
+    - 出力はキュー経由でバックグラウンドのスレッドが行い、処理中のスレッドではディスクへ書き込まない。
     - 設定は settings.py から取得する。
+
+    ログファイルのローテーションはファイル名の変更で行うため、Windowsでは他のプロセスが開いていると失敗する。
+    そのため settings.LOG_FILE_PATH は1つのプロセス（常駐サービス）だけが使う。
+
+    :param rotate: Trueの場合（常駐サービス）、settings.LOG_FILE_PATH に出力し、毎日0時にローテーションして
+                   LOG_BACKUP_DAYS日分を残す。Falseの場合（スケジューラーからの単発実行など）、日付ごとの
+                   別ファイルに追記し、ファイル名の変更は行わない。
     """
+    global _queue_listener
     # getLogger() でルートロガーを取得するのではなく、
     # アプリケーション固有のロガーを取得することで、他のライブラリのログに影響を与えにくくする
     # ここではルートロガーを設定する
@@ -17,6 +52,7 @@ def setup_logging():
     # 既存のハンドラをクリアして、重複して設定されるのを防ぐ
     if root_logger.hasHandlers():
         root_logger.handlers.clear()
+    _stop_queue_listener()
 
     # フォーマッタの作成
     formatter = logging.Formatter(settings.LOG_FORMAT)
@@ -24,11 +60,38 @@ def setup_logging():
     # 1. コンソールへのハンドラ
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
 
     # 2. ファイルへのハンドラ
-    file_handler = logging.FileHandler(settings.LOG_FILE_PATH, mode='a', encoding='utf-8')
+    if rotate:
+        # 常駐時にファイルが際限なく大きくならないよう日次でローテーションする
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            settings.LOG_FILE_PATH, when='midnight', backupCount=LOG_BACKUP_DAYS, encoding='utf-8'
+        )
+    else:
+        # 単発実行は常駐サービスのログを開かず、日付ごとのファイルに追記する（同じ日の実行は同じファイル）
+        _remove_old_run_logs()
+        file_handler = logging.FileHandler(
+            _run_log_path(datetime.date.today()), encoding='utf-8', delay=True
+        )
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
+
+    # 3. ルートロガーにはキューへ積むハンドラだけを登録し、実際の出力はリスナーのスレッドで行う
+    log_queue = queue.Queue(-1)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _queue_listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler)
+    _queue_listener.start()
 
     logging.info("ロギング設定が完了しました。")
+
+
+def _stop_queue_listener():
+    """キューに残っているログを書き出してからリスナーを停止し、出力先のハンドラを閉じる。"""
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        for handler in _queue_listener.handlers:
+            handler.close()
+        _queue_listener = None
+
+
+atexit.register(_stop_queue_listener)
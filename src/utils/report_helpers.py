@@ -1,5 +1,8 @@
 import datetime
 
+import numpy as np
+import pandas as pd
+
 def get_week_of_month(target_date: datetime.date) -> int:
     """
     指定された日付がその月の第何週かを計算する。
@@ -37,6 +40,18 @@ def get_week_of_month(target_date: datetime.date) -> int:
         # 週数を計算し、第1週分を足す
         return (days_after_first_week - 1) // 7 + 2
 
+def get_week_of_month_series(dates: pd.Series) -> pd.Series:
+    """
+    日付のSeriesに対して、get_week_of_monthと同じ週区分を列全体でまとめて計算する。
+    欠損値(NaT)の行はNAを返す。
+    """
+    dates = pd.to_datetime(dates)
+    day = dates.dt.day
+    # 月の初日の曜日を日曜始まり (Sunday=0, Saturday=6) で求める
+    first_day_weekday_sun_start = (dates.dt.weekday - (day - 1) + 1) % 7
+    # 月初日の曜日分だけ日付をずらせば、日曜始まりの7日区切りで週数が決まる
+    return ((day - 1 + first_day_weekday_sun_start) // 7 + 1).astype('Int64')
+
 def get_mrp_type(mrp_controller: str) -> str:
     """
     MRP管理者の文字列から「内製」か「外注」かを判定する。
@@ -53,3 +68,21 @@ def get_mrp_type(mrp_controller: str) -> str:
                 pass # 数値でない or PCの後に文字がない場合は 'その他' にフォールバック
 
     return 'その他'
+
+# get_mrp_type_seriesが返すカテゴリ
+MRP_TYPE_CATEGORIES = ['内製', '外注', 'その他']
+
+def get_mrp_type_series(mrp_controllers: pd.Series) -> pd.Series:
+    """
+    MRP管理者のSeriesに対して、get_mrp_typeと同じ「内製」「外注」「その他」の判定を列全体でまとめて行う。
+    結果は3つのカテゴリを持つカテゴリ型で返す。
+    """
+    # MRP管理者の種類は少ないため、ユニークな値だけをget_mrp_typeで判定して各行に割り当てる
+    # （全角数字や'PC0_1'などもint()と同じく解釈され、判定が常にget_mrp_typeと一致する）
+    codes, uniques = pd.factorize(mrp_controllers)
+    unique_types = np.array([get_mrp_type(value) for value in uniques] + ['その他'], dtype=object)
+    # 欠損値のコード(-1)は末尾の'その他'を指す
+    mrp_types = unique_types[codes]
+    return pd.Series(
+        pd.Categorical(mrp_types, categories=MRP_TYPE_CATEGORIES), index=mrp_controllers.index, name=mrp_controllers.name
+    )
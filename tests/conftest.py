@@ -0,0 +1,27 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from src.models.migration_manager import apply_migrations
+
+@pytest.fixture(scope="session")
+def schema_template():
+    """
+    マイグレーションを1回だけ適用したテンプレートのインメモリデータベース。
+    各テストはこのスキーマをsqlite3のbackup()で複製して使う。
+    """
+    conn = sqlite3.connect(":memory:")
+    apply_migrations(conn)
+    yield conn
+    conn.close()
+
+@pytest.fixture(scope="class")
+def class_schema_template(request, schema_template):
+    """unittest.TestCaseのクラスから、テンプレートを self.template_conn として参照できるようにする。"""
+    request.cls.template_conn = schema_template
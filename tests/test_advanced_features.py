@@ -1,29 +1,40 @@
 import unittest
 import sqlite3
+import pytest
 import pandas as pd
 from pathlib import Path
 import sys
 import datetime
 import tempfile
 import shutil
+from unittest import mock
 
 # Add project root to Python path
 project_root = Path(__file__).resolve().parent.parent
 sys.path.append(str(project_root))
 
-from src.models.migration_manager import apply_migrations
-from src.core.data_processor import DataProcessor
-from src.models.database import insert_production_records
+from src.core.data_processor import DataProcessor, PRODUCTION_READ_DTYPES, pacsv
+from src.core.analytics import ProductionAnalytics
+from src.models.database import (
+    insert_production_records, insert_production_records_from_df, PRODUCTION_RECORD_COLUMNS,
+    is_data_file_processed, record_data_file_processed
+)
 from src.models.production import ProductionRecord
+from src.config import settings
 
+@pytest.mark.usefixtures("class_schema_template")
 class TestAdvancedFeatures(unittest.TestCase):
 
     def setUp(self):
         """Set up an in-memory SQLite database for each test."""
         self.conn = sqlite3.connect(":memory:")
         self.temp_dir = tempfile.mkdtemp()
-        # Run all migrations to get the latest schema
-        apply_migrations(self.conn)
+        # Keep parsed-master caches in this test's directory rather than the shared data/cache
+        cache_patcher = mock.patch.object(settings, 'CACHE_DIR', Path(self.temp_dir))
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        # Copy the fully migrated template schema
+        self.template_conn.backup(self.conn)
 
     def tearDown(self):
         """Close the database connection and remove temp dir after each test."""
@@ -45,9 +56,9 @@ class TestAdvancedFeatures(unittest.TestCase):
         processor.sync_master_from_csv(master_v1_path)
 
         # Check state after first sync
-        master_df_v1 = pd.read_sql_query("SELECT * FROM item_master", self.conn)
-        self.assertEqual(len(master_df_v1), 2)
-        self.assertIn('ITEM_A', master_df_v1['item_code'].values)
+        rows_v1 = self.conn.execute("SELECT item_code FROM item_master").fetchall()
+        self.assertEqual(len(rows_v1), 2)
+        self.assertIn(('ITEM_A',), rows_v1)
 
         # 2. Sync with a second, different version of the master file
         master_v2_content = "品目\t標準原価\nITEM_A\t150\nITEM_C\t300\n"
@@ -58,12 +69,24 @@ class TestAdvancedFeatures(unittest.TestCase):
         processor.sync_master_from_csv(master_v2_path)
 
         # Check state after second sync (should be a full refresh)
-        master_df_v2 = pd.read_sql_query("SELECT * FROM item_master ORDER BY item_code", self.conn)
-        self.assertEqual(len(master_df_v2), 2)
-        self.assertNotIn('ITEM_B', master_df_v2['item_code'].values)
-        self.assertEqual(master_df_v2.loc[0, 'item_code'], 'ITEM_A')
-        self.assertEqual(master_df_v2.loc[0, 'standard_cost'], 150)
-        self.assertEqual(master_df_v2.loc[1, 'item_code'], 'ITEM_C')
+        rows_v2 = self.conn.execute("SELECT item_code, standard_cost FROM item_master ORDER BY item_code").fetchall()
+        self.assertEqual(rows_v2, [('ITEM_A', 150), ('ITEM_C', 300)])
+
+    def test_master_sync_invalidates_processed_data_file(self):
+        """
+        Test that re-syncing the master makes the next run reprocess an unchanged data file,
+        so amounts are recalculated with the new standard costs.
+        """
+        data_path = Path(self.temp_dir) / "KANSEI_JISSEKI.txt"
+        record_data_file_processed(self.conn, data_path, 123, 1)
+        self.assertTrue(is_data_file_processed(self.conn, data_path, 123))
+
+        master_path = Path(self.temp_dir) / "MARA_DL.csv"
+        master_path.write_text("品目\t標準原価\nITEM_A\t100\n", encoding='utf-16')
+        DataProcessor(self.conn).sync_master_from_csv(master_path)
+
+        self.assertEqual(self.conn.execute("SELECT item_code FROM item_master").fetchall(), [('ITEM_A',)])
+        self.assertFalse(is_data_file_processed(self.conn, data_path, 123))
 
     def test_duplicate_record_prevention(self):
         """
@@ -71,7 +94,8 @@ class TestAdvancedFeatures(unittest.TestCase):
         """
         record_1 = ProductionRecord(plant='PC1', item_code='A', item_text='A', order_number='O1', order_type='T1', mrp_controller='PC1', order_quantity=1, actual_quantity=1, cumulative_quantity=1, remaining_quantity=0, input_datetime=datetime.datetime(2025, 8, 25, 10, 0, 0), amount=100)
         record_2 = ProductionRecord(plant='PC1', item_code='B', item_text='B', order_number='O2', order_type='T1', mrp_controller='PC1', order_quantity=1, actual_quantity=1, cumulative_quantity=1, remaining_quantity=0, input_datetime=datetime.datetime(2025, 8, 25, 11, 0, 0), amount=200)
-        record_1_duplicate = ProductionRecord(plant='PC1', item_code='A', item_text='A', order_number='O1', order_type='T1', mrp_controller='PC1', order_quantity=1, actual_quantity=1, cumulative_quantity=1, remaining_quantity=0, input_datetime=datetime.datetime(2025, 8, 25, 10, 0, 0), amount=100)
+        # An identical copy of record_1; model_copy() skips re-running the validators
+        record_1_duplicate = record_1.model_copy()
         records_to_insert = [record_1, record_2, record_1_duplicate]
 
         insert_production_records(self.conn, records_to_insert)
@@ -85,5 +109,180 @@ class TestAdvancedFeatures(unittest.TestCase):
         new_count = cursor.fetchone()[0]
         self.assertEqual(new_count, 2)
 
+    def test_production_summary_tracks_inserted_records(self):
+        """
+        Test that get_summary reflects inserted rows and ignores rejected duplicates.
+        """
+        self.assertEqual(ProductionAnalytics(self.conn).get_summary()['record_count'], 0)
+
+        record_1 = ProductionRecord(plant='PC1', item_code='A', item_text='A', order_number='O1', order_type='T1', mrp_controller='PC1', order_quantity=10, actual_quantity=5, cumulative_quantity=5, remaining_quantity=5, input_datetime=datetime.datetime(2025, 8, 25, 10, 0, 0), amount=100)
+        record_2 = ProductionRecord(plant='PC1', item_code='B', item_text='B', order_number='O2', order_type='T1', mrp_controller='PC1', order_quantity=10, actual_quantity=10, cumulative_quantity=10, remaining_quantity=0, input_datetime=datetime.datetime(2025, 8, 25, 11, 0, 0), amount=200)
+        insert_production_records(self.conn, [record_1, record_2])
+        insert_production_records(self.conn, [record_1])
+
+        summary = ProductionAnalytics(self.conn).get_summary()
+        self.assertEqual(summary, {
+            "total_order_quantity": 20,
+            "total_actual_quantity": 15,
+            "achievement_rate": 75.0,
+            "record_count": 2
+        })
+
+    def test_insert_production_records_from_df_spanning_several_statements(self):
+        """
+        Test that a frame larger than one multi-row INSERT statement is fully inserted.
+        """
+        rows = [
+            ('P100', None, 'A', 'A', f'O{i}', 'T1', 'PC1', 1, 1, 1, 0, f'2025-08-25 10:{i % 60:02d}:00', None, None, None, None, 1.0)
+            for i in range(130)
+        ]
+        df = pd.DataFrame(rows, columns=list(PRODUCTION_RECORD_COLUMNS))
+
+        self.assertEqual(insert_production_records_from_df(self.conn, df), 130)
+        count = self.conn.execute("SELECT COUNT(*) FROM production_records").fetchone()[0]
+        self.assertEqual(count, 130)
+
+    def test_insert_production_records_without_commit(self):
+        """
+        Test that commit=False leaves the batch in the caller's open transaction.
+        """
+        record = ProductionRecord(plant='PC1', item_code='A', item_text='A', order_number='O1', order_type='T1', mrp_controller='PC1', order_quantity=1, actual_quantity=1, cumulative_quantity=1, remaining_quantity=0, input_datetime=datetime.datetime(2025, 8, 25, 10, 0, 0), amount=100)
+
+        insert_production_records(self.conn, [record], commit=False)
+        self.assertTrue(self.conn.in_transaction)
+        self.conn.rollback()
+        count = self.conn.execute("SELECT COUNT(*) FROM production_records").fetchone()[0]
+        self.assertEqual(count, 0)
+
+    def test_production_record_accepts_parsed_planned_completion_date(self):
+        """
+        Test that an already-parsed planned completion date is passed through unchanged.
+        """
+        record = ProductionRecord(plant='PC1', item_code='A', item_text='A', order_number='O1', order_type='T1', mrp_controller='PC1', order_quantity=1, actual_quantity=1, cumulative_quantity=1, remaining_quantity=0, input_datetime=datetime.datetime(2025, 8, 25, 10, 0, 0), planned_completion_date=datetime.date(2025, 8, 28))
+        self.assertEqual(record.planned_completion_date, datetime.date(2025, 8, 28))
+
+        record = ProductionRecord(plant='PC1', item_code='A', item_text='A', order_number='O1', order_type='T1', mrp_controller='PC1', order_quantity=1, actual_quantity=1, cumulative_quantity=1, remaining_quantity=0, input_datetime=datetime.datetime(2025, 8, 25, 10, 0, 0), planned_completion_date='20250828.0')
+        self.assertEqual(record.planned_completion_date, datetime.date(2025, 8, 28))
+
+    def test_amount_keeps_float64_precision(self):
+        """
+        Test that amounts are computed from float64 costs, so costs that are not exact in binary
+        (0.7, 82.6) still give whole-yen amounts.
+        """
+        self.conn.executemany(
+            "INSERT INTO item_master (item_code, standard_cost) VALUES (?, ?)",
+            [('ITEM_A', 0.7), ('ITEM_B', 82.6), ('ITEM_C', 219.89)]
+        )
+        self.conn.commit()
+        header = "プラント\t保管場所\t品目コード\t品目テキスト\t指図番号\t指図タイプ\tMRP管理者\t指図数量\t実績数量\t累計数量\t残数量\t入力日時\n"
+        rows = (
+            "P100\t1120\tITEM_A\tItem A\t50001\tZP11\tPC1\t10\t10\t10\t0\t2025/08/20 10:00\n"
+            "P100\t1120\tITEM_B\tItem B\t50002\tZP11\tPC1\t10\t10\t10\t0\t2025/08/20 10:01\n"
+            "P100\t1120\tITEM_C\tItem C\t50003\tZP11\tPC1\t1\t1\t1\t0\t2025/08/20 10:02\n"
+        )
+        data_path = Path(self.temp_dir) / "KANSEI_JISSEKI.txt"
+        data_path.write_bytes((header + rows).encode('shift_jis'))
+
+        processor = DataProcessor(self.conn)
+        processor.process_file_and_load_to_db(data_path)
+
+        amounts = self.conn.execute("SELECT amount FROM production_records ORDER BY order_number").fetchall()
+        self.assertEqual(amounts, [(7.0,), (826.0,), (219.89,)])
+        self.assertEqual(processor.final_df['amount'].astype(int).tolist(), [7, 826, 219])
+
+    @unittest.skipIf(pacsv is None, "pyarrow is not installed")
+    def test_arrow_read_does_not_modify_read_dtypes(self):
+        """
+        Test that reading a production file with pyarrow leaves the shared dtype mapping unchanged.
+        """
+        header = "プラント\t品目コード\t実績数量\n"
+        data_path = Path(self.temp_dir) / "KANSEI_JISSEKI.txt"
+        data_path.write_bytes((header + "P100\tITEM_A\t1\n").encode('shift_jis'))
+        keys_before = set(PRODUCTION_READ_DTYPES)
+
+        df = DataProcessor(self.conn)._read_production_csv_arrow(data_path, PRODUCTION_READ_DTYPES)
+
+        self.assertEqual(df['実績数量'].tolist(), [1.0])
+        self.assertEqual(set(PRODUCTION_READ_DTYPES), keys_before)
+
+    def test_pipelined_file_processing_inserts_all_chunks(self):
+        """
+        Test that the chunked parse/insert pipeline loads the same rows as processing the whole file,
+        including a duplicate key that spans two chunks.
+        """
+        header = "プラント\t保管場所\t品目コード\t品目テキスト\t指図番号\t指図タイプ\tMRP管理者\t指図数量\t実績数量\t累計数量\t残数量\t入力日時\n"
+        rows = [
+            f"P100\t1120\tITEM{i}\tItem {i}\t5000{i % 4}\tZP11\tPC1\t10\t{i}\t{i}\t0\t2025/08/20 10:0{i % 4}\n"
+            for i in range(7)
+        ] + ["P100\t1120\tITEMX\tItem X\t50009\tZP11\tCC0\t10\t1\t1\t0\t2025/08/20 11:00\n"]
+        data_path = Path(self.temp_dir) / "KANSEI_JISSEKI.txt"
+        data_path.write_bytes((header + "".join(rows)).encode('shift_jis'))
+
+        processor = DataProcessor(self.conn)
+        summary = processor._process_file_pipelined(data_path, {}, chunk_rows=3)
+
+        self.assertEqual(summary['total_rows'], 7)
+        self.assertEqual(summary['successful_inserts'], 7)
+        self.assertFalse(self.conn.in_transaction)
+        rows_in_db = self.conn.execute("SELECT order_number, actual_quantity FROM production_records ORDER BY order_number").fetchall()
+        self.assertEqual(rows_in_db, [('50000', 0), ('50001', 1), ('50002', 2), ('50003', 3)])
+        self.assertEqual(len(processor.final_df), 7)
+
+    def _write_pipeline_comparison_file(self):
+        header = "プラント\t保管場所\t品目コード\t品目テキスト\t指図番号\t指図タイプ\tMRP管理者\t指図数量\t実績数量\t累計数量\t残数量\t入力日時\t計画完了日\tWBS要素\t受注伝票番号\t受注明細番号\n"
+        rows = (
+            "P100\t1120\tITEM_A\tItem A\t50001\tZP11\tPC1\t10\t10\t10\t0\t2025/08/20 10:00\t20250825\t\t000345\t0010\n"
+            "P100\t\t ITEM_B \tItem B\t50002\tZP11\tPC4\t10\t3\t3\t7\t2025/08/20 10:01\t\tWBS-1\t\t\n"
+            "P100\t1120\tITEM_C\tItem C\t50003\tZP11\tCC0\t1\t1\t1\t0\t2025/08/20 10:02\t\t\t\t\n"
+            "P100\t1120\tITEM_A\tItem A\t50004\tZP11\tPC2\t5\tabc\t5\t0\t2025/08/20 10:03\t\t\t\t\n"
+            "P100\t1120\tNOCOST\tNo cost\t50005\tZP11\tPC3\t2\t2\t2\t0\t2025/08/20 10:04\t\t\t\t\n"
+            "P100\t1120\tITEM_B\tItem B\t50006\tZP11\tPC5\t8\t8\t8\t0\tINVALID\t\t\t\t\n"
+            "P100\t1120\tITEM_A\tItem A\t50001\tZP11\tPC1\t10\t10\t10\t0\t2025/08/20 10:00\t\t\t\t\n"
+        )
+        data_path = Path(self.temp_dir) / "KANSEI_JISSEKI.txt"
+        data_path.write_bytes((header + rows).encode('shift_jis'))
+        return data_path
+
+    def test_pipelined_and_whole_file_processing_insert_the_same_rows(self):
+        """
+        Test that the chunked pipeline stores the same rows and amounts as the whole-file path.
+        """
+        data_path = self._write_pipeline_comparison_file()
+        item_costs = {'ITEM_A': 0.7, 'ITEM_B': 82.6, 'ITEM_C': 10.0}
+        columns = ', '.join(PRODUCTION_RECORD_COLUMNS)
+
+        whole_processor = DataProcessor(self.conn)
+        enriched_df, insert_df, invalid_records = whole_processor._parse_file(data_path, item_costs)
+        whole_processor.final_df = enriched_df
+        whole_summary = whole_processor._load_parsed_to_db(data_path, enriched_df, insert_df, invalid_records)
+        whole_rows = self.conn.execute(f"SELECT {columns} FROM production_records ORDER BY id").fetchall()
+
+        pipelined_conn = sqlite3.connect(":memory:")
+        self.addCleanup(pipelined_conn.close)
+        self.template_conn.backup(pipelined_conn)
+        pipelined_processor = DataProcessor(pipelined_conn)
+        pipelined_summary = pipelined_processor._process_file_pipelined(data_path, item_costs, chunk_rows=2)
+        pipelined_rows = pipelined_conn.execute(f"SELECT {columns} FROM production_records ORDER BY id").fetchall()
+
+        self.assertEqual(pipelined_summary, whole_summary)
+        self.assertEqual([row[4] for row in whole_rows], ['50001', '50002', '50005'])
+        self.assertEqual(pipelined_rows, whole_rows)
+        self.assertEqual(pipelined_processor.final_df['amount'].tolist(), whole_processor.final_df['amount'].tolist())
+
+    def test_pipelined_processing_leaves_callers_transaction_open(self):
+        """
+        Test that the pipeline neither commits nor rolls back a transaction the caller already opened.
+        """
+        data_path = self._write_pipeline_comparison_file()
+        self.conn.execute("INSERT INTO item_master (item_code, standard_cost) VALUES ('ITEM_A', 1.0)")
+        self.assertTrue(self.conn.in_transaction)
+
+        DataProcessor(self.conn)._process_file_pipelined(data_path, {'ITEM_A': 1.0}, chunk_rows=2)
+
+        self.assertTrue(self.conn.in_transaction)
+        self.conn.rollback()
+        counts = self.conn.execute("SELECT (SELECT COUNT(*) FROM item_master), (SELECT COUNT(*) FROM production_records)").fetchone()
+        self.assertEqual(counts, (0, 0))
+
 if __name__ == '__main__':
     unittest.main()
@@ -26,31 +26,21 @@ class TestAnalytics(unittest.TestCase):
 
     def _insert_test_data(self):
         """Insert a mix of consistent and inconsistent data for testing."""
+        rows = [
+            # Consistent record
+            ('P100', 'ITEM001', 'Test Item 1', 'ORD001', 'ZP11', 'PC1', 100, 80, 80, 20, '2025-08-21 10:00:00'),
+            # INCONSISTENT record: 100 - 50 != 40
+            ('P100', 'ITEM002', 'Test Item 2', 'ORD002', 'ZP11', 'PC1', 100, 50, 50, 40, '2025-08-21 11:00:00'),
+            # Another consistent record
+            ('P100', 'ITEM003', 'Test Item 3', 'ORD003', 'ZP11', 'PC1', 50, 50, 50, 0, '2025-08-21 12:00:00'),
+        ]
         cursor = self.conn.cursor()
-
-        # Consistent record
-        cursor.execute("""
-        INSERT INTO production_records (
-            plant, item_code, item_text, order_number, order_type, mrp_controller,
-            order_quantity, actual_quantity, cumulative_quantity, remaining_quantity, input_datetime
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, ('P100', 'ITEM001', 'Test Item 1', 'ORD001', 'ZP11', 'PC1', 100, 80, 80, 20, '2025-08-21 10:00:00'))
-
-        # INCONSISTENT record: 100 - 50 != 40
-        cursor.execute("""
-        INSERT INTO production_records (
-            plant, item_code, item_text, order_number, order_type, mrp_controller,
-            order_quantity, actual_quantity, cumulative_quantity, remaining_quantity, input_datetime
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, ('P100', 'ITEM002', 'Test Item 2', 'ORD002', 'ZP11', 'PC1', 100, 50, 50, 40, '2025-08-21 11:00:00'))
-
-        # Another consistent record
-        cursor.execute("""
+        cursor.executemany("""
         INSERT INTO production_records (
             plant, item_code, item_text, order_number, order_type, mrp_controller,
             order_quantity, actual_quantity, cumulative_quantity, remaining_quantity, input_datetime
         ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, ('P100', 'ITEM003', 'Test Item 3', 'ORD003', 'ZP11', 'PC1', 50, 50, 50, 0, '2025-08-21 12:00:00'))
+        """, rows)
 
         self.conn.commit()
 
@@ -0,0 +1,47 @@
+import unittest
+import tempfile
+import shutil
+import threading
+from pathlib import Path
+import sys
+
+# Add project root to Python path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from src.models.db_pool import get_thread_connection, release_thread_connection, close_thread_connections
+
+class TestDbPool(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = Path(self.temp_dir) / "pool.db"
+
+    def tearDown(self):
+        close_thread_connections()
+        shutil.rmtree(self.temp_dir)
+
+    def test_connection_is_reused_within_a_thread(self):
+        """同じスレッドでは同じ接続が返り、別のスレッドには別の接続が返るかテスト"""
+        conn = get_thread_connection(self.db_path)
+        self.assertIs(get_thread_connection(self.db_path), conn)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_thread_connection(self.db_path)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_release_rolls_back_open_transaction(self):
+        """プールへ戻すときに、開いたままのトランザクションが取り消されるかテスト"""
+        conn = get_thread_connection(self.db_path)
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+        self.assertTrue(conn.in_transaction)
+
+        release_thread_connection(conn)
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,22 +5,45 @@ import os
 import datetime
 from pathlib import Path
 import shutil
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
 
 import sys
 project_root = Path(__file__).resolve().parent.parent
 sys.path.append(str(project_root))
 
-from src.models.migration_manager import apply_migrations
 from src.core.data_processor import DataProcessor
-
+from src.config import settings
+
+# Production file rows for the end-to-end test, encoded once at import time
+HEADER = (
+    "プラント\t保管場所\t品目コード\t品目テキスト\t指図番号\t指図タイプ\tMRP管理者\t"
+    "指図数量\t実績数量\t累計数量\t残数量\t入力日時\t計画完了日\tWBS要素\t"
+    "受注伝票番号\t受注明細番号\n"
+)
+VALID_ROW = "P100\t1120\tP001\tTest Item 1\t50001\tZP11\tPC1\t10\t8\t8\t2\t2025/08/20 10:00\t20250825\t\t\t\n"
+ROW_NON_PC = "P100\t1120\tP002\tTest Item 2\t50002\tZP11\tCC0\t20\t10\t10\t10\t2025/08/20 10:05\t20250826\t\t\t\n"
+ROW_BAD_DATE = "P100\t1120\tP004\tTest Item 4\t50004\tZP11\tPC4\t40\t40\t40\t0\tINVALID_DATE\t2025-08-28\t\t\t\n"
+ROW_WITH_WHITESPACE = "P100\t1120\t P005 \tTest Item 5\t50005\tZP11\tPC5\t50\t50\t50\t0\t2025/08/20 10:20\t20250829\t\t000345\t0010\n"
+_END_TO_END_PAYLOAD = (HEADER + VALID_ROW + ROW_NON_PC + ROW_BAD_DATE + ROW_WITH_WHITESPACE).encode('shift_jis')
+
+@pytest.mark.usefixtures("class_schema_template")
 class TestProductionDataPipeline(unittest.TestCase):
 
     def setUp(self):
         self.conn = sqlite3.connect(":memory:")
         self.conn.row_factory = sqlite3.Row
-        apply_migrations(self.conn)
+        self.template_conn.backup(self.conn)
 
         self.temp_dir = tempfile.mkdtemp()
+        # Keep parsed-master caches in this test's directory rather than the shared data/cache
+        cache_patcher = mock.patch.object(settings, 'CACHE_DIR', Path(self.temp_dir) / "cache")
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        settings.CACHE_DIR.mkdir()
         self.master_file_path = Path(self.temp_dir) / "DUMMY_MARA_DL.csv"
         with open(self.master_file_path, 'w', encoding='utf-8') as f:
             f.write("品目\t標準原価\n")
@@ -30,25 +53,13 @@ class TestProductionDataPipeline(unittest.TestCase):
         processor = DataProcessor(self.conn)
         processor.sync_master_from_csv(self.master_file_path)
 
-        self.header = (
-            "プラント\t保管場所\t品目コード\t品目テキスト\t指図番号\t指図タイプ\tMRP管理者\t"
-            "指図数量\t実績数量\t累計数量\t残数量\t入力日時\t計画完了日\tWBS要素\t"
-            "受注伝票番号\t受注明細番号\n"
-        )
-        self.valid_row = "P100\t1120\tP001\tTest Item 1\t50001\tZP11\tPC1\t10\t8\t8\t2\t2025/08/20 10:00\t20250825\t\t\t\n"
-        self.row_non_pc = "P100\t1120\tP002\tTest Item 2\t50002\tZP11\tCC0\t20\t10\t10\t10\t2025/08/20 10:05\t20250826\t\t\t\n"
-        self.row_bad_date = "P100\t1120\tP004\tTest Item 4\t50004\tZP11\tPC4\t40\t40\t40\t0\tINVALID_DATE\t2025-08-28\t\t\t\n"
-        self.row_with_whitespace = "P100\t1120\t P005 \tTest Item 5\t50005\tZP11\tPC5\t50\t50\t50\t0\t2025/08/20 10:20\t20250829\t\t000345\t0010\n"
-
     def tearDown(self):
         self.conn.close()
         shutil.rmtree(self.temp_dir)
 
     def test_data_processing_end_to_end(self):
-        test_data = self.header + self.valid_row + self.row_non_pc + self.row_bad_date + self.row_with_whitespace
-
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False, encoding='shift_jis') as temp_f:
-            temp_f.write(test_data)
+        with tempfile.NamedTemporaryFile('wb', delete=False, suffix='.txt') as temp_f:
+            temp_f.write(_END_TO_END_PAYLOAD)
             temp_file_path = Path(temp_f.name)
 
         processor = DataProcessor(self.conn)
@@ -73,5 +84,150 @@ class TestProductionDataPipeline(unittest.TestCase):
         self.assertIsNotNone(db_record)
         self.assertEqual(db_record['amount'], 50 * 200)
 
+    def _model_cleaning_frame(self):
+        base = {
+            'プラント': 'P100', '保管場所': ' ', '品目コード': 'P001', '品目テキスト': 'Item',
+            '指図番号': '50001', '指図タイプ': 'ZP11', 'MRP管理者': 'PC1',
+            '指図数量': 10.0, '実績数量': 8.0, '累計数量': 8.0, '残数量': 2.0,
+            '入力日時': '2025-08-20 10:00:00', '計画完了日': '20250825.0', 'WBS要素': '',
+            '受注伝票番号': '000345', '受注明細番号': '0000', 'amount': 800.0
+        }
+        return pd.DataFrame([
+            base,
+            {**base, '指図番号': '50002', '受注伝票番号': ' I-0310937-20 ', '受注明細番号': None, '計画完了日': None},
+            {**base, '指図番号': '50003', '品目テキスト': None},
+            {**base, '指図番号': '50004', '指図数量': 1.5},
+            {**base, '指図番号': '50005', '計画完了日': '2025-08-25'},
+        ])
+
+    def _assert_model_cleaning_rows(self):
+        rows = self.conn.execute(
+            "SELECT order_number, storage_location, wbs_element, planned_completion_date, "
+            "sales_order_number, sales_order_item_number, order_quantity, input_datetime "
+            "FROM production_records ORDER BY order_number"
+        ).fetchall()
+        self.assertEqual([tuple(r) for r in rows], [
+            ('50001', None, None, '2025-08-25', '345', '0', 10, '2025-08-20 10:00:00'),
+            ('50002', None, None, None, 'I-0310937-20', None, 10, '2025-08-20 10:00:00'),
+        ])
+
+    def test_ingest_to_db_applies_model_cleaning(self):
+        """ingest_to_db should clean and reject rows the same way ProductionRecord does."""
+        processor = DataProcessor(self.conn)
+        inserted, invalid_records = processor.ingest_to_db(self._model_cleaning_frame())
+
+        self.assertEqual(inserted, 2)
+        self.assertEqual(len(invalid_records), 3)
+        self._assert_model_cleaning_rows()
+
+    def test_ingest_to_db_strict_matches_default(self):
+        """strict=True validates through ProductionRecord and inserts the same rows."""
+        processor = DataProcessor(self.conn, strict=True)
+        inserted, invalid_records = processor.ingest_to_db(self._model_cleaning_frame())
+
+        self.assertEqual(inserted, 2)
+        self.assertEqual(len(invalid_records), 3)
+        self._assert_model_cleaning_rows()
+
+    def test_sync_master_reuses_cache_for_unchanged_file(self):
+        """マスターファイルが変わっていなければ、CSVを解析せずに解析済みキャッシュから同期されること"""
+        master_path = Path(self.temp_dir) / "MARA_DL.csv"
+        master_path.write_text("品目\t標準原価\nP001\t100\n", encoding='utf-16')
+        processor = DataProcessor(self.conn)
+        processor.sync_master_from_csv(master_path)
+        self.assertEqual(len(list(settings.CACHE_DIR.iterdir())), 1)
+
+        with mock.patch.object(DataProcessor, '_parse_master_csv') as parse_master:
+            processor.sync_master_from_csv(master_path)
+        parse_master.assert_not_called()
+        cost = self.conn.execute("SELECT standard_cost FROM item_master WHERE item_code = 'P001'").fetchone()[0]
+        self.assertEqual(cost, 100)
+
+    def test_sync_master_reparses_file_copied_with_same_mtime(self):
+        """更新日時を保ったまま内容が変わったファイルは、キャッシュを使わずに解析し直すこと"""
+        master_path = Path(self.temp_dir) / "MARA_DL.csv"
+        master_path.write_text("品目\t標準原価\nP001\t100\n", encoding='utf-16')
+        processor = DataProcessor(self.conn)
+        processor.sync_master_from_csv(master_path)
+
+        mtime_ns = master_path.stat().st_mtime_ns
+        master_path.write_text("品目\t標準原価\nP001\t9999\n", encoding='utf-16')
+        os.utime(master_path, ns=(mtime_ns, mtime_ns))
+        processor.sync_master_from_csv(master_path)
+
+        cost = self.conn.execute("SELECT standard_cost FROM item_master WHERE item_code = 'P001'").fetchone()[0]
+        self.assertEqual(cost, 9999)
+        # 古いキャッシュは置き換えられる
+        self.assertEqual(len(list(settings.CACHE_DIR.iterdir())), 1)
+
+    def test_sync_master_keeps_caches_of_masters_with_dotted_names(self):
+        """ファイル名の先頭部分が同じ別のマスター（MARA_DL.old.csv）のキャッシュを削除しないこと"""
+        processor = DataProcessor(self.conn)
+        for name in ("MARA_DL.old.csv", "MARA_DL.csv"):
+            master_path = Path(self.temp_dir) / name
+            master_path.write_text("品目\t標準原価\nP001\t100\n", encoding='utf-16')
+            processor.sync_master_from_csv(master_path)
+
+        cache_names = sorted(path.name for path in settings.CACHE_DIR.iterdir())
+        self.assertEqual(len(cache_names), 2)
+        self.assertTrue(cache_names[0].startswith("MARA_DL."))
+        self.assertTrue(cache_names[1].startswith("MARA_DL.old."))
+
+# ProductionRecordのバリデータの境界値。読み込み処理（_prepare_production_frame）の後と同じく、
+# 文字列の列の欠損はNone、数量はfloat、入力日時は整形済みの文字列で渡す
+_VALIDATION_BASE_ROW = {
+    'プラント': 'P100', '保管場所': '1120', '品目コード': 'P001', '品目テキスト': 'Item',
+    '指図番号': '50001', '指図タイプ': 'ZP11', 'MRP管理者': 'PC1',
+    '指図数量': 10.0, '実績数量': 8.0, '累計数量': 8.0, '残数量': 2.0,
+    '入力日時': '2025-08-20 10:00:00', '計画完了日': '20250825', 'WBS要素': 'W-1',
+    '受注伝票番号': '345', '受注明細番号': '10', 'amount': 800.0
+}
+_VALIDATION_EDGE_CASES = {
+    'sap_number_leading_zeros': {'受注伝票番号': '000345', '受注明細番号': '0010'},
+    'sap_number_all_zeros': {'受注伝票番号': '000', '受注明細番号': ' 0 '},
+    'sap_number_not_numeric': {'受注伝票番号': ' I-0310937-20 '},
+    'sap_number_blank': {'受注伝票番号': '', '受注明細番号': ' '},
+    'sap_number_missing': {'受注伝票番号': None},
+    'sap_number_not_text': {'受注伝票番号': 345},
+    'storage_location_blank': {'保管場所': ' ', 'WBS要素': ''},
+    'storage_location_missing': {'保管場所': None, 'WBS要素': None},
+    'storage_location_padded': {'保管場所': ' 1120 ', 'WBS要素': ' W-1 '},
+    'quantity_fraction': {'指図数量': 1.5},
+    'quantity_missing': {'実績数量': np.nan},
+    'quantity_negative_and_zero': {'指図数量': -3.0, '残数量': 0.0},
+    'quantity_text': {'指図数量': '10'},
+    'planned_date_float_text': {'計画完了日': '20250828.0'},
+    'planned_date_float': {'計画完了日': 20250828.0},
+    'planned_date_iso_text': {'計画完了日': '2025-08-28'},
+    'planned_date_object': {'計画完了日': datetime.date(2025, 8, 28)},
+    'planned_date_datetime': {'計画完了日': datetime.datetime(2025, 8, 28)},
+    'planned_date_missing': {'計画完了日': None},
+    'planned_date_blank': {'計画完了日': ' '},
+    'planned_date_invalid': {'計画完了日': '20251332'},
+    'input_datetime_missing': {'入力日時': None},
+    'input_datetime_nat': {'入力日時': pd.NaT},
+    'required_text_missing': {'品目テキスト': None},
+    'required_text_empty': {'品目テキスト': ''},
+    'required_text_padded': {'品目テキスト': ' Item '},
+    'amount_missing': {'amount': np.nan},
+}
+
+@pytest.mark.parametrize("overrides", list(_VALIDATION_EDGE_CASES.values()), ids=list(_VALIDATION_EDGE_CASES))
+def test_ingest_to_db_matches_strict_validation(schema_template, overrides):
+    """列単位の変換（既定）とProductionRecordでの検証（strict=True）が、同じ行を挿入・除外すること"""
+    results = []
+    for strict in (False, True):
+        conn = sqlite3.connect(":memory:")
+        schema_template.backup(conn)
+        df = pd.DataFrame([{**_VALIDATION_BASE_ROW, **overrides}])
+        inserted, invalid_records = DataProcessor(conn, strict=strict).ingest_to_db(df)
+        rows = conn.execute("SELECT * FROM production_records").fetchall()
+        failed_fields = [sorted(error['loc'][0] for error in record['errors']) for record in invalid_records]
+        # idとcreated_atを除いた列を比べる
+        results.append((inserted, failed_fields, [row[1:-1] for row in rows]))
+        conn.close()
+
+    assert results[0] == results[1]
+
 if __name__ == '__main__':
     unittest.main()
@@ -7,7 +7,9 @@ import sys
 project_root = Path(__file__).resolve().parent.parent
 sys.path.append(str(project_root))
 
-from src.utils.report_helpers import get_week_of_month, get_mrp_type
+import pandas as pd
+
+from src.utils.report_helpers import get_week_of_month, get_week_of_month_series, get_mrp_type, get_mrp_type_series
 
 class TestReportHelpers(unittest.TestCase):
 
@@ -25,6 +27,14 @@ class TestReportHelpers(unittest.TestCase):
         self.assertEqual(get_mrp_type(None), 'その他')
         self.assertEqual(get_mrp_type('INVALID'), 'その他')
 
+    def test_get_mrp_type_series(self):
+        """列全体での内製/外注判定がget_mrp_typeと一致するかテスト"""
+        values = ['PC1', 'PC3', 'PC4', 'PC6', 'PC7', 'PC01', 'CC0', '', None, 'INVALID', 'PC', 'PC１', 'PC０_５', 'PC0_1', 'PC 2 ', 'PC1__0']
+        result = get_mrp_type_series(pd.Series(values))
+        self.assertEqual(result.tolist(), [get_mrp_type(v) for v in values])
+        self.assertEqual(result.tolist()[-5:], ['内製', '外注', '内製', '内製', 'その他'])
+        self.assertEqual(list(result.cat.categories), ['内製', '外注', 'その他'])
+
     def test_get_week_of_month(self):
         """月の週区分を正しく計算できるかテスト"""
         # User-provided examples for July 2025
@@ -57,5 +67,15 @@ class TestReportHelpers(unittest.TestCase):
         self.assertEqual(get_week_of_month(datetime.date(2026, 8, 8)), 2)
         self.assertEqual(get_week_of_month(datetime.date(2026, 8, 9)), 3)
 
+    def test_get_week_of_month_series(self):
+        """列全体での週区分計算がget_week_of_monthと一致するかテスト"""
+        dates = pd.date_range('2025-01-01', '2026-12-31', freq='D')
+        expected = [get_week_of_month(d.date()) for d in dates]
+        self.assertEqual(get_week_of_month_series(pd.Series(dates)).tolist(), expected)
+
+        with_nat = get_week_of_month_series(pd.Series([pd.Timestamp('2025-08-03 10:00'), pd.NaT]))
+        self.assertEqual(with_nat.iloc[0], 2)
+        self.assertTrue(pd.isna(with_nat.iloc[1]))
+
 if __name__ == '__main__':
     unittest.main()
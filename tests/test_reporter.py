@@ -1,19 +1,27 @@
+import csv
 import unittest
+import numpy as np
 import pandas as pd
-import datetime
 from pathlib import Path
 import os
 import shutil
 import tempfile
 import sys
+from unittest import mock
 
 # Add project root to Python path
 project_root = Path(__file__).resolve().parent.parent
 sys.path.append(str(project_root))
 
-from src.core.reporter import ReportGenerator
+from src.core.reporter import ReportGenerator, write_quantity_inconsistency_report
 from src.config import settings
 
+def _read_report(report_path):
+    """Read a tab-separated report into its header and a list of row dicts (values kept as written)."""
+    with open(report_path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        return reader.fieldnames, list(reader)
+
 class TestReportGenerator(unittest.TestCase):
 
     def setUp(self):
@@ -21,33 +29,33 @@ class TestReportGenerator(unittest.TestCase):
         self.temp_dir = tempfile.mkdtemp()
         self.reports_dir = Path(self.temp_dir)
 
-        # Override the settings to use the temporary directory
-        self.original_reports_dir = settings.REPORTS_DIR
-        settings.REPORTS_DIR = self.reports_dir
+        # Override the settings to use the temporary directory (restored automatically after each test)
+        patcher = mock.patch.object(settings, 'REPORTS_DIR', self.reports_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
         # Create a sample enriched DataFrame
-        data = {
+        # Columns are built as typed arrays so the DataFrame constructor has no dtype inference to do
+        self.df = pd.DataFrame({
             'MRP管理者': ['PC1', 'PC1', 'PC2', 'PC4', 'PC1'],
-            '入力日時': [
-                datetime.datetime(2025, 7, 26, 10, 0), # Sat, Week 4
-                datetime.datetime(2025, 7, 27, 10, 0), # Sun, Week 5
-                datetime.datetime(2025, 7, 27, 11, 0), # Sun, Week 5
-                datetime.datetime(2025, 8, 1, 10, 0),  # Fri, Week 1
-                datetime.datetime(2025, 8, 3, 10, 0)   # Sun, Week 2
-            ],
+            '入力日時': np.array([
+                '2025-07-26T10:00', # Sat, Week 4
+                '2025-07-27T10:00', # Sun, Week 5
+                '2025-07-27T11:00', # Sun, Week 5
+                '2025-08-01T10:00', # Fri, Week 1
+                '2025-08-03T10:00'  # Sun, Week 2
+            ], dtype='datetime64[ns]'),
             '指図番号': ['O1', 'O2', 'O3', 'O4', 'O5'],
             '品目コード': ['A', 'B', 'A', 'C', 'B'],
             '品目テキスト': ['Item A', 'Item B', 'Item A', 'Item C', 'Item B'],
-            '指図数量': [10, 20, 5, 10, 15],
-            '実績数量': [10, 15, 5, 8, 15],
-            'amount': [1000, 1500, 500, 800, 1500]
-        }
-        self.df = pd.DataFrame(data)
+            '指図数量': np.array([10, 20, 5, 10, 15], dtype='int64'),
+            '実績数量': np.array([10, 15, 5, 8, 15], dtype='int64'),
+            'amount': np.array([1000, 1500, 500, 800, 1500], dtype='int64')
+        })
         self.reporter = ReportGenerator(self.df)
 
     def tearDown(self):
-        """Clean up the temporary directory and restore settings."""
-        settings.REPORTS_DIR = self.original_reports_dir
+        """Clean up the temporary directory."""
         shutil.rmtree(self.temp_dir)
 
     def test_generate_details_report(self):
@@ -56,14 +64,14 @@ class TestReportGenerator(unittest.TestCase):
         report_path = self.reports_dir / "明細_抜粋.txt"
         self.assertTrue(report_path.exists())
 
-        result_df = pd.read_csv(report_path, sep='\t')
-        self.assertEqual(len(result_df), 5)
+        header, rows = _read_report(report_path)
+        self.assertEqual(len(rows), 5)
         expected_cols = ['MRP管理者', '完成日', '指図', '品目コード', '品目テキスト', '計画数', '完成数', '金額', '週区分']
-        self.assertListEqual(list(result_df.columns), expected_cols)
-        self.assertEqual(result_df.loc[0, '週区分'], 4)
-        self.assertEqual(result_df.loc[1, '週区分'], 5)
-        self.assertEqual(result_df.loc[3, '週区分'], 1)
-        self.assertEqual(result_df.loc[4, '週区分'], 2)
+        self.assertListEqual(header, expected_cols)
+        self.assertEqual(rows[0]['週区分'], '4')
+        self.assertEqual(rows[1]['週区分'], '5')
+        self.assertEqual(rows[3]['週区分'], '1')
+        self.assertEqual(rows[4]['週区分'], '2')
 
     def test_generate_daily_summary(self):
         """Test the generation of the daily summary report."""
@@ -71,12 +79,13 @@ class TestReportGenerator(unittest.TestCase):
         report_path = self.reports_dir / "日別サマリー.txt"
         self.assertTrue(report_path.exists())
 
-        result_df = pd.read_csv(report_path, sep='\t')
-        self.assertEqual(len(result_df), 4) # 4 unique days
+        _, rows = _read_report(report_path)
+        self.assertEqual(len(rows), 4) # 4 unique days
 
         # Select rows by date to make the test robust against sorting order
-        self.assertEqual(result_df[result_df['完成日'] == '2025-07-26']['日別金額'].iloc[0], 1000)
-        self.assertEqual(result_df[result_df['完成日'] == '2025-07-27']['日別金額'].iloc[0], 2000)
+        daily_amounts = {row['完成日']: row['日別金額'] for row in rows}
+        self.assertEqual(daily_amounts['2025-07-26'], '1000')
+        self.assertEqual(daily_amounts['2025-07-27'], '2000')
 
     def test_generate_weekly_summary(self):
         """Test the generation of the weekly summary report."""
@@ -84,16 +93,31 @@ class TestReportGenerator(unittest.TestCase):
         report_path = self.reports_dir / "週別サマリー.txt"
         self.assertTrue(report_path.exists())
 
-        result_df = pd.read_csv(report_path, sep='\t')
-        self.assertEqual(len(result_df), 5) # 4 weeks + total row
+        _, rows = _read_report(report_path)
+        self.assertEqual(len(rows), 5) # 4 weeks + total row
+        totals = {row['週区分']: row['合計'] for row in rows}
 
         # Find the row for week 5 of July
-        week_5_total = result_df[result_df['週区分'] == '5']['合計'].iloc[0]
-        self.assertEqual(week_5_total, 2000) # 1500 + 500
+        self.assertEqual(totals['5'], '2000') # 1500 + 500
 
         # Check the grand total row
-        grand_total = result_df[result_df['週区分'] == '合計']['合計'].iloc[0]
-        self.assertEqual(grand_total, self.df['amount'].sum())
+        self.assertEqual(totals['合計'], str(self.df['amount'].sum()))
+
+    def test_write_quantity_inconsistency_report(self):
+        """Test that inconsistencies are written to a file, and a stale file is removed when there are none."""
+        inconsistencies = pd.DataFrame({
+            'id': [2], 'order_number': ['ORD002'], 'item_code': ['ITEM002'], 'item_text': ['Test Item 2'],
+            'order_quantity': [100], 'cumulative_quantity': [50], 'remaining_quantity': [40], 'expected_remaining': [50]
+        })
+        report_path = write_quantity_inconsistency_report(inconsistencies)
+        self.assertEqual(report_path, self.reports_dir / "数量不整合.txt")
+
+        _, rows = _read_report(report_path)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['expected_remaining'], '50')
+
+        self.assertIsNone(write_quantity_inconsistency_report(pd.DataFrame()))
+        self.assertFalse(report_path.exists())
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,107 +1,204 @@
+import os
 import pytest
 import sqlite3
-import pandas as pd
 from pathlib import Path
 
 from src.core.wip_processor import WipDataProcessor
 from src.core.analytics import WipAnalysis, PcStockAnalysis
-from src.models.migration_manager import apply_migrations
+
+# テスト用のダミーデータ。内容は固定のため、cp932へのエンコードはモジュールの読み込み時に1回だけ行う。
+
+# 1. 仕掛明細データ (フィルタ条件を満たすように修正)
+_WIP_HEADER = "キー\tﾌﾟﾗﾝﾄ\tMRP管理者\t工場\tライン\tﾈｯﾄﾜｰｸ/指図番号\tテキスト\t金額（国内通貨）\t品目\t初期数量\t仕掛数\t完成数量\t初期実績日付\t仕掛年齢\tCMPL\t材料\t経費\n"
+_WIP_BYTES = (
+    "header\n" * 3 +
+    _WIP_HEADER +
+    "NW\tkey1\tPC1\tF1\tL1\t50001\tItem 1\t1,000\tITEM001\t10\t5\t5\t2025年8月\t1ケ月\t\t500\t500\n"
+    "NW\tkey2\tPC2\tF2\tL2\t50002\tItem 2\t2,000\tITEM002\t20\t20\t0\t2025年7月\t2ケ月\t\t1000\t1000\n"
+    "NW\tkey3\tPC1\tF1\tL1\t50003\tItem 3\t500\tITEM003\t5\t0\t5\t2025年6月\t3ケ月\t\t250\t250\n"
+).encode("cp932")
+
+# 2. ZP02データ (フィルタ条件を満たすように修正)
+_ZP02_HEADER = "MRP管理者\tMRP管理者名\t指図番号\t指図ステータス\t品目コード\t品目テキスト\t台数\tＷＢＳ要素\tDLV日付\tTECO日付\n"
+_ZP02_BYTES = (
+    _ZP02_HEADER +
+    "PC1\tPC1_Name\t50001\tREL\tITEM001\tItem 1\t10\tWBS001\t\t\n"
+    "PC2\tPC2_Name\t50002\tREL\tITEM002\tItem 2\t20\tWBS002\t\t\n"
+    "PC1\tPC1_Name\t50003\tTECO\tITEM003\tItem 3\t5\tWBS003\t\t2025-09-01\n"
+).encode("cp932")
+
+# 3. ZP58データ (フィルタ条件を満たすように修正)
+_ZP58_BYTES = "指図／ネットワーク\n50002\n".encode("cp932")
+
+# 4. 保管場所一覧データ
+_SL_HEADER = "ﾌﾟﾗﾝﾄ\t責任部署\t棚卸報告区分\t保管場所\t保管場所名\t工場在庫区分\t営業在庫区分\t工場区分\t工場区分2\t使用不可区分\t棚番チェック用\t所要check\n"
+_SL_BYTES = (
+    _SL_HEADER +
+    "P100\t製造2部\t3_PC\t1120\t滋賀ＰＣ倉庫（ＡＷＣ）\tYes\tNo\t滋賀工場\t滋賀工場\t\tTrue\t1_使用可\n"
+).encode("cp932")
+
+# 5. ZS65データ (フィルタ条件を満たすように修正)
+_ZS65_HEADER = "品目コード\t品目テキスト\t保管場所\tplant\t滞留日数\t利用可能値\t利用可能評価在庫\n"
+_ZS65_BYTES = (
+    _ZS65_HEADER +
+    "ITEM001\tTest Item ZS65\t1120\tP100\t500\t10000\t10\n"
+).encode("cp932")
 
 @pytest.fixture
-def db_conn():
+def db_conn(schema_template):
     """
     テスト用のインメモリSQLiteデータベース接続を提供するフィクスチャ。
     """
     conn = sqlite3.connect(":memory:")
-    apply_migrations(conn)
+    schema_template.backup(conn)
     yield conn
     conn.close()
 
-@pytest.fixture
-def sample_data_files(tmp_path):
+@pytest.fixture(scope="session")
+def sample_data_files(tmp_path_factory):
     """
     テスト用のダミーデータファイルを作成するフィクスチャ。
+    内容は固定でテストから書き換えないため、セッション全体で1回だけ作成する。
     """
-    data_dir = tmp_path / "data"
-    data_dir.mkdir()
-
-    # 1. 仕掛明細データ (フィルタ条件を満たすように修正)
-    wip_header = "キー\tﾌﾟﾗﾝﾄ\tMRP管理者\t工場\tライン\tﾈｯﾄﾜｰｸ/指図番号\tテキスト\t金額（国内通貨）\t品目\t初期数量\t仕掛数\t完成数量\t初期実績日付\t仕掛年齢\tCMPL\t材料\t経費\n"
-    wip_content = (
-        "header\n" * 3 +
-        wip_header +
-        "NW\tkey1\tPC1\tF1\tL1\t50001\tItem 1\t1,000\tITEM001\t10\t5\t5\t2025年8月\t1ケ月\t\t500\t500\n"
-        "NW\tkey2\tPC2\tF2\tL2\t50002\tItem 2\t2,000\tITEM002\t20\t20\t0\t2025年7月\t2ケ月\t\t1000\t1000\n"
-        "NW\tkey3\tPC1\tF1\tL1\t50003\tItem 3\t500\tITEM003\t5\t0\t5\t2025年6月\t3ケ月\t\t250\t250\n"
-    )
+    data_dir = tmp_path_factory.mktemp("data")
+
     wip_file = data_dir / "wip_details.csv"
-    wip_file.write_text(wip_content, encoding="cp932")
-
-    # 2. ZP02データ (フィルタ条件を満たすように修正)
-    zp02_header = "MRP管理者\tMRP管理者名\t指図番号\t指図ステータス\t品目コード\t品目テキスト\t台数\tＷＢＳ要素\tDLV日付\tTECO日付\n"
-    zp02_content = (
-        zp02_header +
-        "PC1\tPC1_Name\t50001\tREL\tITEM001\tItem 1\t10\tWBS001\t\t\n"
-        "PC2\tPC2_Name\t50002\tREL\tITEM002\tItem 2\t20\tWBS002\t\t\n"
-        "PC1\tPC1_Name\t50003\tTECO\tITEM003\tItem 3\t5\tWBS003\t\t2025-09-01\n"
-    )
+    wip_file.write_bytes(_WIP_BYTES)
     zp02_file = data_dir / "ZP02.TXT"
-    zp02_file.write_text(zp02_content, encoding="cp932")
-
-    # 3. ZP58データ (フィルタ条件を満たすように修正)
-    zp58_content = "指図／ネットワーク\n50002\n"
+    zp02_file.write_bytes(_ZP02_BYTES)
     zp58_file = data_dir / "ZP58.txt"
-    zp58_file.write_text(zp58_content, encoding="cp932")
-
-    # 4. 保管場所一覧データ
-    sl_header = "ﾌﾟﾗﾝﾄ\t責任部署\t棚卸報告区分\t保管場所\t保管場所名\t工場在庫区分\t営業在庫区分\t工場区分\t工場区分2\t使用不可区分\t棚番チェック用\t所要check\n"
-    sl_content = (
-        sl_header +
-        "P100\t製造2部\t3_PC\t1120\t滋賀ＰＣ倉庫（ＡＷＣ）\tYes\tNo\t滋賀工場\t滋賀工場\t\tTrue\t1_使用可\n"
-    )
+    zp58_file.write_bytes(_ZP58_BYTES)
     sl_file = data_dir / "storage_locations.csv"
-    sl_file.write_text(sl_content, encoding="cp932")
-
-    # 5. ZS65データ (フィルタ条件を満たすように修正)
-    zs65_header = "品目コード\t品目テキスト\t保管場所\tplant\t滞留日数\t利用可能値\t利用可能評価在庫\n"
-    zs65_content = (
-        zs65_header +
-        "ITEM001\tTest Item ZS65\t1120\tP100\t500\t10000\t10\n"
-    )
+    sl_file.write_bytes(_SL_BYTES)
     zs65_file = data_dir / "ZS65.TXT"
-    zs65_file.write_text(zs65_content, encoding="cp932")
+    zs65_file.write_bytes(_ZS65_BYTES)
 
     return wip_file, zp02_file, zp58_file, sl_file, zs65_file
 
-
-def test_wip_data_processor(db_conn, sample_data_files):
+@pytest.fixture(scope="session")
+def populated_template(schema_template, sample_data_files):
+    """
+    サンプルデータをrun_allで1回だけ読み込んだテンプレートのインメモリデータベース。
+    読み込み結果は同じファイルから常に同じになるため、分析のテストはこれをbackup()で複製して使う。
+    """
     wip_file, zp02_file, zp58_file, sl_file, zs65_file = sample_data_files
-    processor = WipDataProcessor(db_conn)
-    processor.run_all(wip_file, zp58_file, zp02_file, sl_file, zs65_file)
+    conn = sqlite3.connect(":memory:")
+    schema_template.backup(conn)
+    WipDataProcessor(conn).run_all(wip_file, zp58_file, zp02_file, sl_file, zs65_file)
+    yield conn
+    conn.close()
 
-    wip_df = pd.read_sql_query("SELECT * FROM wip_details", db_conn)
-    zp02_df = pd.read_sql_query("SELECT * FROM zp02_records", db_conn)
-    sl_df = pd.read_sql_query("SELECT * FROM storage_locations", db_conn)
-    zs65_df = pd.read_sql_query("SELECT * FROM zs65_records", db_conn)
+@pytest.fixture
+def populated_db_conn(populated_template):
+    """
+    サンプルデータを読み込み済みのインメモリSQLiteデータベース接続を提供するフィクスチャ。
+    """
+    conn = sqlite3.connect(":memory:")
+    populated_template.backup(conn)
+    yield conn
+    conn.close()
 
-    assert len(wip_df) == 3
-    assert len(zp02_df) == 3
-    assert len(sl_df) == 1
-    assert len(zs65_df) == 1
 
-def test_wip_analysis_summary(db_conn, sample_data_files):
-    wip_file, zp02_file, zp58_file, sl_file, zs65_file = sample_data_files
-    processor = WipDataProcessor(db_conn)
-    processor.run_all(wip_file, zp58_file, zp02_file, sl_file, zs65_file)
-    analyzer = WipAnalysis(db_conn)
+def test_wip_data_processor(populated_db_conn):
+    counts = populated_db_conn.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM wip_details),
+            (SELECT COUNT(*) FROM zp02_records),
+            (SELECT COUNT(*) FROM storage_locations),
+            (SELECT COUNT(*) FROM zs65_records)
+    """).fetchone()
+
+    assert counts == (3, 3, 1, 1)
+
+def test_wip_analysis_summary(populated_db_conn):
+    analyzer = WipAnalysis(populated_db_conn)
     summary_df = analyzer.get_wip_summary_comparison()
     assert not summary_df.empty
 
-def test_pc_stock_analysis(db_conn, sample_data_files):
-    wip_file, zp02_file, zp58_file, sl_file, zs65_file = sample_data_files
-    processor = WipDataProcessor(db_conn)
-    processor.run_all(wip_file, zp58_file, zp02_file, sl_file, zs65_file)
-    analyzer = PcStockAnalysis(db_conn)
+def test_pc_stock_analysis(populated_db_conn):
+    analyzer = PcStockAnalysis(populated_db_conn)
     summary_df = analyzer.get_pc_stock_summary()
     assert not summary_df.empty
     assert summary_df.iloc[0]['金額'] == 10000
+
+def test_run_all_skips_unchanged_files(db_conn, tmp_path):
+    """元ファイルの更新日時が前回のロード時と同じテーブルは再ロードしない。"""
+    zp58_file = tmp_path / "ZP58.txt"
+    zp58_file.write_text("指図／ネットワーク\n50002\n", encoding="utf-8")
+    missing = tmp_path / "missing.txt"
+    processor = WipDataProcessor(db_conn)
+
+    processor.run_all(missing, zp58_file, missing, missing, missing)
+    assert db_conn.execute("SELECT order_number FROM zp58_records").fetchall() == [('50002',)]
+
+    # テーブルを書き換えても、ファイルが変わっていなければそのまま残る
+    db_conn.execute("INSERT INTO zp58_records (order_number) VALUES ('99999')")
+    db_conn.commit()
+    processor.run_all(missing, zp58_file, missing, missing, missing)
+    assert len(db_conn.execute("SELECT * FROM zp58_records").fetchall()) == 2
+
+    # 更新日時が変われば読み込み直す
+    mtime_ns = zp58_file.stat().st_mtime_ns + 1_000_000_000
+    os.utime(zp58_file, ns=(mtime_ns, mtime_ns))
+    processor.run_all(missing, zp58_file, missing, missing, missing)
+    assert db_conn.execute("SELECT order_number FROM zp58_records").fetchall() == [('50002',)]
+
+def _raise_read_error(*args, **kwargs):
+    raise OSError("read failed")
+
+@pytest.mark.parametrize("target, replacement", [
+    # ファイルの読み込みに失敗する場合
+    ("pandas.read_csv", _raise_read_error),
+    # 既存テーブルをDROPした後、テーブルの作成に失敗する場合
+    ("pandas.io.sql.get_schema", lambda *args, **kwargs: "CREATE TABLE zp58_records ("),
+])
+def test_failed_load_keeps_previous_rows(db_conn, tmp_path, monkeypatch, target, replacement):
+    """ロードに失敗したテーブルは空にならず、前回ロードしたデータが残る。"""
+    zp58_file = tmp_path / "ZP58.txt"
+    zp58_file.write_text("指図／ネットワーク\n50002\n", encoding="utf-8")
+    missing = tmp_path / "missing.txt"
+    processor = WipDataProcessor(db_conn)
+    processor.run_all(missing, zp58_file, missing, missing, missing)
+
+    mtime_ns = zp58_file.stat().st_mtime_ns + 1_000_000_000
+    os.utime(zp58_file, ns=(mtime_ns, mtime_ns))
+    monkeypatch.setattr(target, replacement)
+    processor.run_all(missing, zp58_file, missing, missing, missing)
+
+    assert db_conn.execute("SELECT order_number FROM zp58_records").fetchall() == [('50002',)]
+    # 失敗したロードは記録せず、次回は読み込み直す
+    assert db_conn.execute("SELECT COUNT(*) FROM etl_meta WHERE table_name = 'zp58_records'").fetchone()[0] == 0
+
+def test_text_columns_are_stored_as_text(db_conn, tmp_path):
+    """文字列の列は、pyarrowの有無にかかわらず日付や数値に推論されずTEXTのまま保存される。"""
+    sl_file = tmp_path / "storage_locations.csv"
+    sl_file.write_text("ﾌﾟﾗﾝﾄ\t責任部署\t保管場所\nP100\t2025-08-01\t1120\n", encoding="utf-8-sig")
+    zs65_file = tmp_path / "ZS65.TXT"
+    zs65_file.write_text("品目コード\t品目テキスト\t保管場所\tプラント\t利用可能値\n00123\tItem\t1120\tP100\t100\n", encoding="utf-8")
+    processor = WipDataProcessor(db_conn)
+    processor.process_storage_locations(sl_file)
+    processor.process_zs65(zs65_file)
+
+    sl_types = {row[1]: row[2] for row in db_conn.execute("PRAGMA table_info(storage_locations)")}
+    assert sl_types == {'plant': 'TEXT', 'responsible_dept': 'TEXT', 'storage_location': 'INTEGER'}
+    assert db_conn.execute("SELECT item_code, storage_location FROM zs65_records").fetchall() == [('00123', 1120)]
+
+def test_run_all_loads_files_in_parallel_for_file_database(schema_template, tmp_path):
+    """ファイルDBでは各ファイルを別スレッド・別接続で読み込み、結果はすべて同じDBに残る。"""
+    db_path = tmp_path / "test.db"
+    conn = sqlite3.connect(db_path)
+    schema_template.backup(conn)
+    zp58_file = tmp_path / "ZP58.txt"
+    zp58_file.write_text("指図／ネットワーク\n0050002\n", encoding="utf-8")
+    sl_file = tmp_path / "storage_locations.csv"
+    sl_file.write_text("ﾌﾟﾗﾝﾄ\t保管場所\nP100\t1120\n", encoding="utf-8-sig")
+    missing = tmp_path / "missing.txt"
+    try:
+        WipDataProcessor(conn).run_all(missing, zp58_file, missing, sl_file, missing)
+
+        assert conn.execute("SELECT order_number FROM zp58_records").fetchall() == [('50002',)]
+        assert conn.execute("SELECT plant, storage_location FROM storage_locations").fetchall() == [('P100', 1120)]
+        loaded = conn.execute("SELECT table_name FROM etl_meta ORDER BY table_name").fetchall()
+        assert loaded == [('storage_locations',), ('zp58_records',)]
+    finally:
+        conn.close()